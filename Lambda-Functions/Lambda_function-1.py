@@ -1,14 +1,10 @@
-import json
 import logging
 import time
-from opensearchpy import OpenSearch, RequestsHttpConnection
-import boto3
 import os
-from requests_aws4auth import AWS4Auth
-from cv_processor import CVProcessor
-from job_scraper import JobScraper
-from opensearch_manager import OpenSearchManager
-from embedding_service import EmbeddingService
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+import orjson
+from opensearch_endpoint import get_opensearch_host, lookup_opensearch_host
 
 # Configure logging
 logger = logging.getLogger()
@@ -17,110 +13,174 @@ logger.setLevel(logging.INFO)
 # ====== OpenSearch Config ======
 region = os.environ.get("APP_REGION", "us-east-1")
 
+def _now_ms():
+    """Current epoch time in integer milliseconds"""
+    return time.time_ns() // 1_000_000
+
+def _dumps(obj):
+    """Serialize a response body to a JSON string"""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
 def get_opensearch_endpoint():
-    """Get OpenSearch domain endpoint with proper error handling"""
-    try:
-        # Method 1: Try environment variable first
-        endpoint = os.environ.get("OPENSEARCH_ENDPOINT")
-        if endpoint:
-            host = endpoint.replace('https://', '').replace('http://', '').strip()
-            logger.info(f"Using OpenSearch host from environment: {host}")
-            return host
-        
-        # Method 2: Get from AWS OpenSearch API
-        domain_name = os.environ.get("OPENSEARCH_DOMAIN_NAME", "new-job-recommendationdomain")
-        
-        try:
-            opensearch_client = boto3.client('opensearch', region_name=region)
-            response = opensearch_client.describe_domain(DomainName=domain_name)
-            endpoint = response['DomainStatus']['Endpoint']
-            host = endpoint.replace('https://', '').replace('http://', '').strip()
-            logger.info(f"Retrieved OpenSearch host from AWS API: {host}")
-            return host
-        except Exception as e:
-            logger.warning(f"Could not retrieve from AWS API: {str(e)}")
-        
-        # Method 3: Hardcoded fallback based on your domain
-        fallback_host = "search-new-job-recommendationdomain-equlis5ogx733rohqkaxrlabu4.us-east-1.es.amazonaws.com"
-        logger.info(f"Using hardcoded fallback host: {fallback_host}")
-        return fallback_host
-        
-    except Exception as e:
-        logger.error(f"Error getting OpenSearch endpoint: {str(e)}")
-        # Final fallback
-        return "search-new-job-recommendationdomain-equlis5ogx733rohqkaxrlabu4.us-east-1.es.amazonaws.com"
+    """Get OpenSearch domain endpoint, resolved the same way as for OpenSearchManager"""
+    # OPENSEARCH_ENDPOINT, else the domain's endpoint from the AWS API (once per container)
+    host = get_opensearch_host(region)
+    if os.environ.get("OPENSEARCH_ENDPOINT"):
+        logger.info(f"Using OpenSearch host from environment: {host}")
+    return host
 
-# Get the clean host
-host = get_opensearch_endpoint()
-logger.info(f"Final OpenSearch host: {host}")
+def _resolve_endpoint_on_failure():
+    """Look up the domain endpoint through the AWS API again after the current host failed.
+
+    Returns True if a different host was found; the client and the shared manager are then reset.
+    """
+    global host, _client
+    if os.environ.get("OPENSEARCH_ENDPOINT"):
+        return False
+    
+    resolved_host = lookup_opensearch_host(region)
+    if resolved_host is None or resolved_host == host:
+        return False
+    
+    host = resolved_host
+    _client = None
+    from opensearch_manager import update_host
+    update_host(resolved_host)
+    return True
+
+# Resolved when the client is first created, so INIT makes no AWS API call
+host = None
 
 cv_index = "cv-index"
 job_index = "job-index"
 
-# Initialize AWS auth
-credentials = boto3.Session().get_credentials()
-awsauth = AWS4Auth(credentials.access_key,
-                   credentials.secret_key,
-                   region,
-                   "es",
-                   session_token=credentials.token)
-
-# Initialize OpenSearch client
-client = OpenSearch(
-    hosts=[{'host': host, 'port': 443}],
-    http_auth=awsauth,
-    use_ssl=True,
-    verify_certs=True,
-    connection_class=RequestsHttpConnection,
-    timeout=60,
-    max_retries=3,
-    retry_on_timeout=True
-)
+# Search body fragments shared by every request. OpenSearch serialization
+# doesn't mutate them, so handlers reference these directly.
+_MATCH_ALL = {"match_all": {}}
+_DEFAULT_SORT = [{"_score": {"order": "desc"}}]  # Sort by relevance score
+# The job index mapping strips job_embedding from _source, but only indices created
+# with it do; excluding it here keeps older indices from returning the vectors too
+_EXCLUDE_EMBEDDINGS = {"excludes": ["cv_embedding", "job_embedding"]}
+_HIT_FIELDS = itemgetter('_id', '_score', '_source')
+_EMPTY_DESCRIPTION_FILTERS = [
+    {"term": {"description": ""}},
+    {"bool": {"must_not": {"exists": {"field": "description"}}}}
+]
+
+# Heavy SDK modules and service classes are imported on first use so that
+# invocations which never touch them don't pay for them during INIT.
+# Instances are kept at module scope and reused by warm invocations.
+_client = None
+_cv_processor = None
+_job_scraper = None
+_embedding_service = None
+
+def get_opensearch_client():
+    """Get the shared OpenSearch client, creating it on first use"""
+    global _client, host
+    if _client is None:
+        import boto3
+        from opensearchpy import OpenSearch, RequestsHttpConnection
+        from requests_aws4auth import AWS4Auth
+        
+        if host is None:
+            host = get_opensearch_endpoint()
+        logger.info(f"Final OpenSearch host: {host}")
+        
+        # Initialize AWS auth. Passing the boto3 credentials object (rather than
+        # its current keys) lets the signer pick up rotated role credentials on
+        # long-lived warm containers.
+        credentials = boto3.Session().get_credentials()
+        awsauth = AWS4Auth(region=region,
+                           service="es",
+                           refreshable_credentials=credentials)
+        
+        # Initialize OpenSearch client
+        _client = OpenSearch(
+            hosts=[{'host': host, 'port': 443}],
+            http_auth=awsauth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=RequestsHttpConnection,
+            pool_maxsize=10,  # Keep TLS connections alive across warm invocations
+            http_compress=True,  # Also sends Accept-Encoding: gzip for responses
+            timeout=10,  # Fail fast on a stuck coordinator instead of holding the invocation
+            max_retries=3,
+            retry_on_timeout=True
+        )
+    return _client
+
+def get_opensearch_manager():
+    """Get the shared OpenSearchManager, creating it on first use"""
+    from opensearch_manager import get_manager
+    return get_manager()
+
+def get_cv_processor():
+    """Get the shared CVProcessor, creating it on first use"""
+    global _cv_processor
+    if _cv_processor is None:
+        from cv_processor import CVProcessor
+        _cv_processor = CVProcessor(opensearch=get_opensearch_manager(),
+                                    embedding_service=get_embedding_service())
+    return _cv_processor
+
+def get_job_scraper():
+    """Get the shared JobScraper, creating it on first use"""
+    global _job_scraper
+    if _job_scraper is None:
+        from job_scraper import JobScraper
+        _job_scraper = JobScraper()
+    return _job_scraper
+
+def get_embedding_service():
+    """Get the shared EmbeddingService, creating it on first use"""
+    global _embedding_service
+    if _embedding_service is None:
+        from embedding_service import EmbeddingService
+        _embedding_service = EmbeddingService()
+    return _embedding_service
+
+def search_opensearch(index_name, body):
+    """Run a search, re-resolving the endpoint once if the host is unreachable"""
+    from opensearchpy.exceptions import ConnectionError as OpenSearchConnectionError
+    try:
+        return get_opensearch_client().search(index=index_name, body=body)
+    except OpenSearchConnectionError:
+        if not _resolve_endpoint_on_failure():
+            raise
+        return get_opensearch_client().search(index=index_name, body=body)
+
+# Keys that mark an event as a previously returned query result
+_QUERY_RESULT_MARKERS = frozenset(('success', 'total_hits', 'results'))
 
 def lambda_handler(event, context):
     """
     Enhanced Lambda handler supporting API Gateway requests and direct queries
     """
     try:
-        logger.info(f"Received event: {json.dumps(event, default=str)}")
-
-        # Handle direct OpenSearch query requests FIRST
-        if 'query' in event and isinstance(event['query'], dict):
-            logger.info("Detected OpenSearch query in event")
-            return handle_opensearch_query(event, context)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received event: %s", _dumps(event))
 
-        # Handle API Gateway requests
-        elif 'httpMethod' in event:
-            return handle_api_gateway_request(event, context)
-        
-        # Handle S3 events (CV processing)
-        elif 'Records' in event and event['Records']:
-            return handle_cv_processing(event, context)
-        
-        # Handle CloudWatch events (job scraping)
-        elif 'source' in event and event['source'] == 'aws.events':
-            return handle_job_scraping(event, context)
-        
-        # Handle manual invocation with task
-        elif 'task' in event:
-            return handle_manual_invoke(event, context)
+        # Dispatch on the first route whose key is present and predicate matches
+        for key, predicate, handler in _ROUTES:
+            if key in event and (predicate is None or predicate(event)):
+                return handler(event, context)
         
         # Handle unknown events - could be query-related
-        else:
-            logger.warning(f"Unrecognized event format: {list(event.keys())}")
-            # Check if this could be a malformed query
-            if any(key in event for key in ['success', 'total_hits', 'results']):
-                logger.info("Event looks like query results, treating as test data")
-                return {
-                    'statusCode': 200,
-                    'body': json.dumps({
-                        'message': 'Received what appears to be query results',
-                        'event_type': 'query_results',
-                        'event_data': event
-                    }, default=str)
-                }
-            else:
-                return handle_manual_invoke(event, context)
+        logger.warning(f"Unrecognized event format: {list(event.keys())}")
+        # Check if this could be a malformed query
+        if event.keys() & _QUERY_RESULT_MARKERS:
+            logger.info("Event looks like query results, treating as test data")
+            return {
+                'statusCode': 200,
+                'body': _dumps({
+                    'message': 'Received what appears to be query results',
+                    'event_type': 'query_results',
+                    'event_data': event
+                })
+            }
+        
+        return handle_manual_invoke(event, context)
 
     except Exception as e:
         logger.error(f"Error in lambda_handler: {str(e)}", exc_info=True)
@@ -134,21 +194,20 @@ def handle_opensearch_query(event, context):
         size = event.get('size', 10)  # Default size
         from_param = event.get('from', 0)  # Default from
         
-        logger.info(f"Executing OpenSearch query on index '{index_name}': {json.dumps(query)}")
+        logger.info(f"Executing OpenSearch query on index '{index_name}'")
+        logger.debug("OpenSearch query: %s", query)
         
         # Build the search body
         search_body = {
             'query': query,
             'size': size,
-            'from': from_param
+            'from': from_param,
+            # Count hits accurately only up to 10k instead of across every shard match
+            'track_total_hits': event.get('track_total_hits', 10000)
         }
         
         # Add sorting if specified
-        if 'sort' in event:
-            search_body['sort'] = event['sort']
-        else:
-            # Default sort by relevance score
-            search_body['sort'] = [{"_score": {"order": "desc"}}]
+        search_body['sort'] = event.get('sort', _DEFAULT_SORT)
             
         # Add filters to exclude jobs with empty descriptions if requested
         filters = event.get('filters', {})
@@ -156,38 +215,25 @@ def handle_opensearch_query(event, context):
             search_body['query'] = {
                 "bool": {
                     "must": [query],
-                    "must_not": [
-                        {"term": {"description": ""}},
-                        {"bool": {"must_not": {"exists": {"field": "description"}}}}
-                    ]
+                    "must_not": _EMPTY_DESCRIPTION_FILTERS
                 }
             }
             
         # Add source filtering to exclude embeddings from response (too large)
-        search_body['_source'] = {
-            "excludes": ["job_embedding", "cv_embedding"]
-        }
+        search_body['_source'] = _EXCLUDE_EMBEDDINGS
         
         # Execute the search
-        start_time = time.time()
-        response = client.search(
-            index=index_name,
-            body=search_body
-        )
-        execution_time = time.time() - start_time
+        start_ns = time.perf_counter_ns()
+        response = search_opensearch(index_name, search_body)
+        execution_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
         
         # Process results
         hits = response.get('hits', {})
         total_hits = hits.get('total', {}).get('value', 0)
-        results = []
-        
-        for hit in hits.get('hits', []):
-            result = {
-                'id': hit.get('_id'),
-                'score': hit.get('_score'),
-                'source': hit.get('_source', {})
-            }
-            results.append(result)
+        results = [
+            {'id': hit_id, 'score': score, 'source': source or {}}
+            for hit_id, score, source in map(_HIT_FIELDS, hits.get('hits', ()))
+        ]
         
         # Build response
         query_response = {
@@ -196,7 +242,7 @@ def handle_opensearch_query(event, context):
             'index': index_name,
             'total_hits': total_hits,
             'returned_hits': len(results),
-            'execution_time_seconds': round(execution_time, 3),
+            'execution_time_ms': execution_time_ms,
             'opensearch_took_ms': response.get('took', 0),
             'results': results,
             'aggregations': response.get('aggregations', {}),
@@ -211,7 +257,7 @@ def handle_opensearch_query(event, context):
         
         return {
             'statusCode': 200,
-            'body': json.dumps(query_response, default=str)
+            'body': _dumps(query_response)
         }
         
     except Exception as e:
@@ -225,13 +271,13 @@ def handle_opensearch_query(event, context):
         
         return {
             'statusCode': 500,
-            'body': json.dumps(error_response)
+            'body': _dumps(error_response)
         }
 
 def execute_opensearch_aggregation(event, context):
     """Execute OpenSearch aggregation queries"""
     try:
-        query = event.get('query', {"match_all": {}})
+        query = event.get('query', _MATCH_ALL)
         aggregations = event.get('aggregations', {})
         index_name = event.get('index', job_index)
         
@@ -243,26 +289,23 @@ def execute_opensearch_aggregation(event, context):
             'size': 0  # We only want aggregations, not documents
         }
         
-        response = client.search(
-            index=index_name,
-            body=search_body
-        )
+        response = search_opensearch(index_name, search_body)
         
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': _dumps({
                 'success': True,
                 'aggregations': response.get('aggregations', {}),
                 'total_documents': response.get('hits', {}).get('total', {}).get('value', 0),
                 'took_ms': response.get('took', 0)
-            }, default=str)
+            })
         }
         
     except Exception as e:
         logger.error(f"Error executing aggregation: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': _dumps({
                 'success': False,
                 'error': str(e)
             })
@@ -280,8 +323,8 @@ def handle_api_gateway_request(event, context):
         body = {}
         if event.get('body'):
             try:
-                body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-            except json.JSONDecodeError:
+                body = orjson.loads(event['body']) if isinstance(event['body'], str) else event['body']
+            except orjson.JSONDecodeError:
                 return create_api_response(400, {'error': 'Invalid JSON in request body'})
         
         # Route requests
@@ -320,10 +363,13 @@ def handle_recommendation_request(body, context):
         logger.info(f"Getting recommendations for user: {user_id}")
         
         # Initialize services
-        opensearch_manager = OpenSearchManager()
+        from opensearch_manager import recommendation_filters
+        opensearch_manager = get_opensearch_manager()
         
-        # Step 1: Get user's CV embedding from OpenSearch
-        cv_result = opensearch_manager.get_cv_by_user_id(user_id)
+        # Step 1: Get user's CV, the job count and the similar jobs (unfiltered and per
+        # optional location/role filter) in as few round trips as the caches allow
+        filters = recommendation_filters(body)
+        cv_result, total_jobs, job_results = opensearch_manager.recommend_for_user(user_id, size=10, filters=filters)
         
         if not cv_result:
             return create_api_response(404, {
@@ -331,16 +377,13 @@ def handle_recommendation_request(body, context):
                 'user_id': user_id
             })
         
-        cv_embedding = cv_result.get('cv_embedding')
-        if not cv_embedding:
+        if not cv_result.get('cv_embedding'):
             return create_api_response(400, {
                 'error': 'CV embedding not available. Please re-upload your CV.',
                 'user_id': user_id
             })
         
-        # Step 2: Search for similar jobs
-        similar_jobs = opensearch_manager.search_similar_jobs(cv_embedding, size=10)
-        
+        similar_jobs = job_results['all']
         if not similar_jobs or not similar_jobs.get('hits', {}).get('hits'):
             return create_api_response(404, {
                 'message': 'No matching jobs found at the moment.',
@@ -348,33 +391,14 @@ def handle_recommendation_request(body, context):
                 'recommendations': []
             })
         
-        # Step 3: Format recommendations
-        recommendations = []
-        for hit in similar_jobs['hits']['hits']:
-            job_data = hit['_source']
-            similarity_score = hit.get('_score', 0)
-            
-            # Calculate match percentage (normalize score to 0-100)
-            match_percentage = min(100, max(0, int(similarity_score * 10)))  # Adjust multiplier as needed
-            
-            recommendation = {
-                'job_id': job_data.get('job_id', hit['_id']),
-                'title': job_data.get('title', 'Job Title Not Available'),
-                'company': job_data.get('company', 'Company Name Not Available'),
-                'description': job_data.get('description', 'No description available'),
-                'location': job_data.get('location', 'Location not specified'),
-                'job_url': job_data.get('job_url', ''),
-                'skills_required': job_data.get('skills_required', []),
-                'experience_level': job_data.get('experience_level', 'Not specified'),
-                'salary_range': job_data.get('salary_range', 'Not specified'),
-                'match_percentage': match_percentage,
-                'similarity_score': similarity_score,
-                'scraped_date': job_data.get('scraped_date')
-            }
-            
-            recommendations.append(recommendation)
+        # Step 2: Format recommendations
+        recommendations = format_recommendations(similar_jobs['hits']['hits'])
+        search_metadata = {
+            'total_jobs_in_database': total_jobs or similar_jobs.get('hits', {}).get('total', {}).get('value', 0),
+            'search_took_ms': similar_jobs.get('took', 0)
+        }
         
-        # Step 4: Get user's CV metadata for personalization
+        # Step 3: Get user's CV metadata for personalization
         cv_metadata = {
             'skills_extracted': cv_result.get('skills_extracted', []),
             'experience_years': cv_result.get('experience_years', 0),
@@ -386,11 +410,13 @@ def handle_recommendation_request(body, context):
             'total_recommendations': len(recommendations),
             'user_profile': cv_metadata,
             'recommendations': recommendations,
-            'search_metadata': {
-                'total_jobs_in_database': similar_jobs.get('hits', {}).get('total', {}).get('value', 0),
-                'search_took_ms': similar_jobs.get('took', 0)
-            }
+            'search_metadata': search_metadata
         }
+        if filters:
+            response_data['filtered_recommendations'] = {
+                name: format_recommendations(job_results[name]['hits']['hits']) if name in job_results else []
+                for name in filters
+            }
         
         logger.info(f"Successfully generated {len(recommendations)} recommendations for user {user_id}")
         return create_api_response(200, response_data)
@@ -399,17 +425,38 @@ def handle_recommendation_request(body, context):
         logger.error(f"Error getting recommendations: {str(e)}")
         return create_api_response(500, {'error': f'Failed to get recommendations: {str(e)}'})
 
+def format_recommendations(hits):
+    """Format OpenSearch k-NN hits as job recommendations"""
+    return [
+        {
+            'job_id': job_data.get('job_id', hit_id),
+            'title': job_data.get('title', 'Job Title Not Available'),
+            'company': job_data.get('company', 'Company Name Not Available'),
+            'description': job_data.get('description', 'No description available'),
+            'location': job_data.get('location', 'Location not specified'),
+            'job_url': job_data.get('job_url', ''),
+            'skills_required': job_data.get('skills_required', []),
+            'experience_level': job_data.get('experience_level', 'Not specified'),
+            'salary_range': job_data.get('salary_range', 'Not specified'),
+            # Calculate match percentage (normalize score to 0-100)
+            'match_percentage': min(100, max(0, int(similarity_score * 10))),  # Adjust multiplier as needed
+            'similarity_score': similarity_score,
+            'scraped_date': job_data.get('scraped_date')
+        }
+        for hit_id, similarity_score, job_data in map(_HIT_FIELDS, hits)
+    ]
+
 def handle_status_request():
     """Handle status check requests"""
     try:
-        opensearch_manager = OpenSearchManager()
+        opensearch_manager = get_opensearch_manager()
         status = opensearch_manager.test_connection()
         
         return create_api_response(200, {
             'system_status': 'operational',
             'opensearch_status': status,
             'lambda_version': '1.0.0',
-            'timestamp': int(time.time() * 1000)
+            'timestamp': _now_ms()
         })
         
     except Exception as e:
@@ -422,11 +469,11 @@ def handle_test_request(body):
         test_type = body.get('test_type', 'connection')
         
         if test_type == 'connection':
-            opensearch_manager = OpenSearchManager()
+            opensearch_manager = get_opensearch_manager()
             result = opensearch_manager.test_connection()
             
         elif test_type == 'embedding':
-            embedding_service = EmbeddingService()
+            embedding_service = get_embedding_service()
             result = embedding_service.test_service()
             
         else:
@@ -452,46 +499,61 @@ def handle_manual_invoke(event, context):
         if task == 'test_small_scrape':
             # Test job scraping functionality
             logger.info("Running test job scraping")
-            job_scraper = JobScraper()
+            job_scraper = get_job_scraper()
             result = job_scraper.scrape_small_batch()  # Implement this method in JobScraper
             
             return {
                 'statusCode': 200,
-                'body': json.dumps({
+                'body': _dumps({
                     'message': 'Test scraping completed',
                     'task': task,
                     'result': result
-                }, default=str)
+                })
             }
             
         elif task == 'test_connection':
             # Test OpenSearch connection
             logger.info("Testing OpenSearch connection")
-            opensearch_manager = OpenSearchManager()
+            opensearch_manager = get_opensearch_manager()
             status = opensearch_manager.test_connection()
             
             return {
                 'statusCode': 200,
-                'body': json.dumps({
+                'body': _dumps({
                     'message': 'Connection test completed',
                     'task': task,
                     'opensearch_status': status
-                }, default=str)
+                })
+            }
+            
+        elif task == 'create_indices':
+            # Create the CV and job indices with their mappings
+            logger.info("Creating OpenSearch indices")
+            opensearch_manager = get_opensearch_manager()
+            result = opensearch_manager.create_indices()
+            
+            return {
+                'statusCode': 200,
+                'body': _dumps({
+                    'message': 'Index creation completed',
+                    'task': task,
+                    'result': result
+                })
             }
             
         elif task == 'process_pending_cvs':
             # Process any pending CVs
             logger.info("Processing pending CVs")
-            cv_processor = CVProcessor()
+            cv_processor = get_cv_processor()
             result = cv_processor.process_pending()  # Implement this method
             
             return {
                 'statusCode': 200,
-                'body': json.dumps({
+                'body': _dumps({
                     'message': 'CV processing completed',
                     'task': task,
                     'result': result
-                }, default=str)
+                })
             }
             
         elif task == 'health_check':
@@ -500,28 +562,32 @@ def handle_manual_invoke(event, context):
             
             health_status = {
                 'lambda_status': 'healthy',
-                'timestamp': int(time.time() * 1000)
+                'timestamp': _now_ms()
             }
             
+            # The OpenSearch and Bedrock checks are independent network calls,
+            # so run them concurrently instead of one after the other
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                opensearch_future = executor.submit(lambda: get_opensearch_manager().test_connection())
+                embedding_future = executor.submit(lambda: get_embedding_service().test_service())
+            
             try:
-                opensearch_manager = OpenSearchManager()
-                health_status['opensearch_status'] = opensearch_manager.test_connection()
+                health_status['opensearch_status'] = opensearch_future.result()
             except Exception as e:
                 health_status['opensearch_status'] = f'error: {str(e)}'
             
             try:
-                embedding_service = EmbeddingService()
-                health_status['embedding_service'] = embedding_service.test_service()
+                health_status['embedding_service'] = embedding_future.result()
             except Exception as e:
                 health_status['embedding_service'] = f'error: {str(e)}'
             
             return {
                 'statusCode': 200,
-                'body': json.dumps({
+                'body': _dumps({
                     'message': 'Health check completed',
                     'task': task,
                     'health_status': health_status
-                }, default=str)
+                })
             }
             
         else:
@@ -530,24 +596,25 @@ def handle_manual_invoke(event, context):
             
             return {
                 'statusCode': 200,
-                'body': json.dumps({
+                'body': _dumps({
                     'message': 'Lambda function is working',
                     'task': task,
                     'event_received': event,
                     'available_tasks': [
                         'test_small_scrape',
                         'test_connection', 
+                        'create_indices',
                         'process_pending_cvs',
                         'health_check'
                     ]
-                }, default=str)
+                })
             }
             
     except Exception as e:
         logger.error(f"Error in handle_manual_invoke: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': _dumps({
                 'error': str(e),
                 'task': event.get('task', 'unknown')
             })
@@ -558,39 +625,33 @@ def handle_cv_processing(event, context):
     try:
         logger.info("Processing CV upload from S3")
         
-        processed_files = []
+        records = event['Records']
         
-        for record in event['Records']:
-            # Extract S3 information
-            s3_bucket = record['s3']['bucket']['name']
-            s3_key = record['s3']['object']['key']
-            
-            logger.info(f"Processing file: {s3_key} from bucket: {s3_bucket}")
-            
-            # Initialize CV processor
-            cv_processor = CVProcessor()
-            
-            # Process the CV
-            result = cv_processor.process_s3_file(s3_bucket, s3_key)
-            processed_files.append({
-                'file': s3_key,
-                'bucket': s3_bucket,
+        # Records are fetched, embedded and indexed concurrently
+        results = get_cv_processor().process_cv_records(records)
+        
+        processed_files = [
+            {
+                'file': record['s3']['object']['key'],
+                'bucket': record['s3']['bucket']['name'],
                 'result': result
-            })
+            }
+            for record, result in zip(records, results)
+        ]
         
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': _dumps({
                 'message': f'Processed {len(processed_files)} CV files',
                 'processed_files': processed_files
-            }, default=str)
+            })
         }
         
     except Exception as e:
         logger.error(f"Error processing CV: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
+            'body': _dumps({'error': str(e)})
         }
 
 def handle_job_scraping(event, context):
@@ -599,35 +660,53 @@ def handle_job_scraping(event, context):
         logger.info("Starting scheduled job scraping")
         
         # Initialize job scraper
-        job_scraper = JobScraper()
+        job_scraper = get_job_scraper()
         
         # Run the scraping process
         result = job_scraper.run_scheduled_scrape()
         
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': _dumps({
                 'message': 'Job scraping completed',
                 'result': result
-            }, default=str)
+            })
         }
         
     except Exception as e:
         logger.error(f"Error in job scraping: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
+            'body': _dumps({'error': str(e)})
         }
 
+# Shared by every API Gateway response, which only serializes it
+_CORS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',  # Configure this properly for production
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
+
 def create_api_response(status_code, body):
     """Create standardized API Gateway response"""
     return {
         'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',  # Configure this properly for production
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-        },
-        'body': json.dumps(body, default=str)
-    }
\ No newline at end of file
+        'headers': _CORS_HEADERS,
+        'body': _dumps(body)
+    }
+
+# Event routing table for lambda_handler, checked in order:
+# (key that must be in the event, optional predicate on the event, handler)
+_ROUTES = (
+    # Direct OpenSearch query requests FIRST
+    ('query', lambda event: isinstance(event['query'], dict), handle_opensearch_query),
+    # API Gateway requests
+    ('httpMethod', None, handle_api_gateway_request),
+    # S3 events (CV processing)
+    ('Records', lambda event: bool(event['Records']), handle_cv_processing),
+    # CloudWatch events (job scraping)
+    ('source', lambda event: event['source'] == 'aws.events', handle_job_scraping),
+    # Manual invocation with task
+    ('task', None, handle_manual_invoke),
+)
\ No newline at end of file
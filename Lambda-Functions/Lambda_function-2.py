@@ -7,7 +7,8 @@ import os
 from requests_aws4auth import AWS4Auth
 from cv_processor import CVProcessor
 from job_scraper import JobScraper
-from opensearch_manager import OpenSearchManager
+from opensearch_manager import get_manager, recommendation_filters
+from opensearch_endpoint import get_opensearch_host
 from embedding_service import EmbeddingService
 
 # Configure logging
@@ -18,37 +19,9 @@ logger.setLevel(logging.INFO)
 region = os.environ.get("APP_REGION", "us-east-1")
 
 def get_opensearch_endpoint():
-    """Get OpenSearch domain endpoint with proper error handling"""
-    try:
-        # Method 1: Try environment variable first
-        endpoint = os.environ.get("OPENSEARCH_ENDPOINT")
-        if endpoint:
-            host = endpoint.replace('https://', '').replace('http://', '').strip()
-            logger.info(f"Using OpenSearch host from environment: {host}")
-            return host
-        
-        # Method 2: Get from AWS OpenSearch API
-        domain_name = os.environ.get("OPENSEARCH_DOMAIN_NAME", "new-job-recommendationdomain")
-        
-        try:
-            opensearch_client = boto3.client('opensearch', region_name=region)
-            response = opensearch_client.describe_domain(DomainName=domain_name)
-            endpoint = response['DomainStatus']['Endpoint']
-            host = endpoint.replace('https://', '').replace('http://', '').strip()
-            logger.info(f"Retrieved OpenSearch host from AWS API: {host}")
-            return host
-        except Exception as e:
-            logger.warning(f"Could not retrieve from AWS API: {str(e)}")
-        
-        # Method 3: Hardcoded fallback based on your domain
-        fallback_host = "search-new-job-recommendationdomain-equlis5ogx733rohqkaxrlabu4.us-east-1.es.amazonaws.com"
-        logger.info(f"Using hardcoded fallback host: {fallback_host}")
-        return fallback_host
-        
-    except Exception as e:
-        logger.error(f"Error getting OpenSearch endpoint: {str(e)}")
-        # Final fallback
-        return "search-new-job-recommendationdomain-equlis5ogx733rohqkaxrlabu4.us-east-1.es.amazonaws.com"
+    """Get OpenSearch domain endpoint, resolved the same way as for OpenSearchManager"""
+    # OPENSEARCH_ENDPOINT, else the domain's endpoint from the AWS API (once per container)
+    return get_opensearch_host(region)
 
 # Get the clean host
 host = get_opensearch_endpoint()
@@ -320,10 +293,12 @@ def handle_recommendation_request(body, context):
         logger.info(f"Getting recommendations for user: {user_id}")
         
         # Initialize services
-        opensearch_manager = OpenSearchManager()
+        opensearch_manager = get_manager()
         
-        # Step 1: Get user's CV embedding from OpenSearch
-        cv_result = opensearch_manager.get_cv_by_user_id(user_id)
+        # Step 1: Get user's CV, the job count and the similar jobs (unfiltered and per
+        # optional location/role filter) in as few round trips as the caches allow
+        filters = recommendation_filters(body)
+        cv_result, total_jobs, job_results = opensearch_manager.recommend_for_user(user_id, size=10, filters=filters)
         
         if not cv_result:
             return create_api_response(404, {
@@ -331,16 +306,13 @@ def handle_recommendation_request(body, context):
                 'user_id': user_id
             })
         
-        cv_embedding = cv_result.get('cv_embedding')
-        if not cv_embedding:
+        if not cv_result.get('cv_embedding'):
             return create_api_response(400, {
                 'error': 'CV embedding not available. Please re-upload your CV.',
                 'user_id': user_id
             })
         
-        # Step 2: Search for similar jobs
-        similar_jobs = opensearch_manager.search_similar_jobs(cv_embedding, size=10)
-        
+        similar_jobs = job_results['all']
         if not similar_jobs or not similar_jobs.get('hits', {}).get('hits'):
             return create_api_response(404, {
                 'message': 'No matching jobs found at the moment.',
@@ -348,33 +320,10 @@ def handle_recommendation_request(body, context):
                 'recommendations': []
             })
         
-        # Step 3: Format recommendations
-        recommendations = []
-        for hit in similar_jobs['hits']['hits']:
-            job_data = hit['_source']
-            similarity_score = hit.get('_score', 0)
-            
-            # Calculate match percentage (normalize score to 0-100)
-            match_percentage = min(100, max(0, int(similarity_score * 10)))  # Adjust multiplier as needed
-            
-            recommendation = {
-                'job_id': job_data.get('job_id', hit['_id']),
-                'title': job_data.get('title', 'Job Title Not Available'),
-                'company': job_data.get('company', 'Company Name Not Available'),
-                'description': job_data.get('description', 'No description available'),
-                'location': job_data.get('location', 'Location not specified'),
-                'job_url': job_data.get('job_url', ''),
-                'skills_required': job_data.get('skills_required', []),
-                'experience_level': job_data.get('experience_level', 'Not specified'),
-                'salary_range': job_data.get('salary_range', 'Not specified'),
-                'match_percentage': match_percentage,
-                'similarity_score': similarity_score,
-                'scraped_date': job_data.get('scraped_date')
-            }
-            
-            recommendations.append(recommendation)
+        # Step 2: Format recommendations
+        recommendations = format_recommendations(similar_jobs['hits']['hits'])
         
-        # Step 4: Get user's CV metadata for personalization
+        # Step 3: Get user's CV metadata for personalization
         cv_metadata = {
             'skills_extracted': cv_result.get('skills_extracted', []),
             'experience_years': cv_result.get('experience_years', 0),
@@ -387,10 +336,15 @@ def handle_recommendation_request(body, context):
             'user_profile': cv_metadata,
             'recommendations': recommendations,
             'search_metadata': {
-                'total_jobs_in_database': similar_jobs.get('hits', {}).get('total', {}).get('value', 0),
+                'total_jobs_in_database': total_jobs or similar_jobs.get('hits', {}).get('total', {}).get('value', 0),
                 'search_took_ms': similar_jobs.get('took', 0)
             }
         }
+        if filters:
+            response_data['filtered_recommendations'] = {
+                name: format_recommendations(job_results[name]['hits']['hits']) if name in job_results else []
+                for name in filters
+            }
         
         logger.info(f"Successfully generated {len(recommendations)} recommendations for user {user_id}")
         return create_api_response(200, response_data)
@@ -399,10 +353,39 @@ def handle_recommendation_request(body, context):
         logger.error(f"Error getting recommendations: {str(e)}")
         return create_api_response(500, {'error': f'Failed to get recommendations: {str(e)}'})
 
+def format_recommendations(hits):
+    """Format OpenSearch k-NN hits as job recommendations"""
+    recommendations = []
+    for hit in hits:
+        job_data = hit['_source']
+        similarity_score = hit.get('_score', 0)
+        
+        # Calculate match percentage (normalize score to 0-100)
+        match_percentage = min(100, max(0, int(similarity_score * 10)))  # Adjust multiplier as needed
+        
+        recommendation = {
+            'job_id': job_data.get('job_id', hit['_id']),
+            'title': job_data.get('title', 'Job Title Not Available'),
+            'company': job_data.get('company', 'Company Name Not Available'),
+            'description': job_data.get('description', 'No description available'),
+            'location': job_data.get('location', 'Location not specified'),
+            'job_url': job_data.get('job_url', ''),
+            'skills_required': job_data.get('skills_required', []),
+            'experience_level': job_data.get('experience_level', 'Not specified'),
+            'salary_range': job_data.get('salary_range', 'Not specified'),
+            'match_percentage': match_percentage,
+            'similarity_score': similarity_score,
+            'scraped_date': job_data.get('scraped_date')
+        }
+        
+        recommendations.append(recommendation)
+    
+    return recommendations
+
 def handle_status_request():
     """Handle status check requests"""
     try:
-        opensearch_manager = OpenSearchManager()
+        opensearch_manager = get_manager()
         status = opensearch_manager.test_connection()
         
         return create_api_response(200, {
@@ -422,7 +405,7 @@ def handle_test_request(body):
         test_type = body.get('test_type', 'connection')
         
         if test_type == 'connection':
-            opensearch_manager = OpenSearchManager()
+            opensearch_manager = get_manager()
             result = opensearch_manager.test_connection()
             
         elif test_type == 'embedding':
@@ -467,7 +450,7 @@ def handle_manual_invoke(event, context):
         elif task == 'test_connection':
             # Test OpenSearch connection
             logger.info("Testing OpenSearch connection")
-            opensearch_manager = OpenSearchManager()
+            opensearch_manager = get_manager()
             status = opensearch_manager.test_connection()
             
             return {
@@ -504,7 +487,7 @@ def handle_manual_invoke(event, context):
             }
             
             try:
-                opensearch_manager = OpenSearchManager()
+                opensearch_manager = get_manager()
                 health_status['opensearch_status'] = opensearch_manager.test_connection()
             except Exception as e:
                 health_status['opensearch_status'] = f'error: {str(e)}'
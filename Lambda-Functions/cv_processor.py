@@ -1,20 +1,111 @@
+import codecs
 import json
 import logging
+import os
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 import boto3
-from opensearch_manager import OpenSearchManager
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from opensearch_manager import OpenSearchManager, get_manager
 from embedding_service import EmbeddingService
-from utils import extract_user_id_from_key, clean_text
+from utils import extract_user_id_from_key, clean_text, build_keyword_automaton, find_keywords
 
 logger = logging.getLogger(__name__)
 
+SKILL_KEYWORDS = (
+    # Programming Languages
+    'python', 'java', 'javascript', 'typescript', 'c++', 'c#', 'php', 'ruby',
+    'go', 'rust', 'kotlin', 'swift', 'scala', 'r', 'matlab', 'sql',
+    
+    # Web Technologies
+    'html', 'css', 'react', 'angular', 'vue', 'node.js', 'express', 'django',
+    'flask', 'spring', 'laravel', 'bootstrap', 'jquery',
+    
+    # Cloud & DevOps
+    'aws', 'azure', 'gcp', 'docker', 'kubernetes', 'jenkins', 'git',
+    'terraform', 'ansible',
+    
+    # Databases
+    'mysql', 'postgresql', 'mongodb', 'redis', 'elasticsearch', 'oracle',
+    
+    # Data Science
+    'machine learning', 'deep learning', 'tensorflow', 'pytorch',
+    'pandas', 'numpy', 'scikit-learn', 'tableau', 'power bi',
+    
+    # Design & Marketing
+    'photoshop', 'illustrator', 'figma', 'sketch', 'adobe', 'canva',
+    'seo', 'sem', 'google analytics', 'social media',
+    
+    # Business & Finance
+    'excel', 'powerpoint', 'salesforce', 'crm', 'erp', 'sap',
+    'accounting', 'finance', 'project management'
+)
+
+# Aho-Corasick automaton over all skills: a CV is scanned once in time linear in its
+# length, however many keywords there are. Word boundaries match the previous \b patterns.
+_SKILLS_AUTOMATON = build_keyword_automaton(SKILL_KEYWORDS)
+
+# Display form stored for each matched skill, computed once instead of per CV.
+# str.title() would turn "node.js" into "Node.Js".
+_SKILL_DISPLAY = {skill: skill.title() for skill in SKILL_KEYWORDS}
+_SKILL_DISPLAY['node.js'] = 'Node.js'
+
+# "5+ years of experience", "experience: 5 years", "5 years in python" and "5 yrs experience".
+# Each pattern is scanned separately: a match consumes its text, e.g. the "10" in
+# "5 years in 10 years in java", so merging them into one scan would change the result.
+_EXPERIENCE_PATTERNS = [
+    re.compile(r'(\d+)\+?\s*years?\s*(?:of\s*)?experience'),
+    re.compile(r'experience\s*[:\-]?\s*(\d+)\+?\s*years?'),
+    re.compile(r'(\d+)\+?\s*years?\s*in\s*\w+'),
+    re.compile(r'(\d+)\+?\s*yrs?\s*(?:of\s*)?experience')
+]
+
+# Substring matches (e.g. "engineer" also matches "engineering"), case-insensitive
+_TITLE_KEYWORD_PATTERN = re.compile(
+    'engineer|developer|manager|analyst|specialist|consultant|architect|designer|scientist|lead|'
+    'director|coordinator|administrator|technician|representative|executive|officer|assistant',
+    re.IGNORECASE
+)
+_NON_TITLE_PATTERN = re.compile('email|phone|address|linkedin|github', re.IGNORECASE)
+
+# Only the start of a CV is embedded (8000 characters), so don't download the rest.
+# 16 KB leaves room for multi-byte characters and the whitespace clean_text removes.
+MAX_CV_BYTES = int(os.environ.get("MAX_CV_BYTES", 16384))
+
+# Shared by every CVProcessor in the container. The pool is sized above
+# MAX_RECORD_WORKERS so concurrent GETs never wait for a connection.
+_s3_client = boto3.client(
+    's3',
+    config=Config(max_pool_connections=32, tcp_keepalive=True, retries={'mode': 'standard'})
+)
+
+# Upper bound on records processed concurrently; S3 and Bedrock calls are I/O bound
+MAX_RECORD_WORKERS = 16
+
 class CVProcessor:
-    def __init__(self):
-        self.s3_client = boto3.client('s3')
-        self.opensearch = OpenSearchManager()
-        self.embedding_service = EmbeddingService()
+    def __init__(self, opensearch: Optional[OpenSearchManager] = None,
+                 embedding_service: Optional[EmbeddingService] = None):
+        self.s3_client = _s3_client
+        # Callers that already hold these (e.g. the Lambda handler's module-level
+        # instances) pass them in, so their connection pools are shared
+        self.opensearch = opensearch or get_manager()
+        self.embedding_service = embedding_service or EmbeddingService()
+    
+    def process_cv_records(self, records: List[Dict]) -> List[Dict]:
+        """Process several S3 CV records concurrently, returning results in record order"""
+        if len(records) <= 1:
+            results = [self.process_cv_record(record) for record in records]
+        else:
+            with ThreadPoolExecutor(max_workers=min(MAX_RECORD_WORKERS, len(records))) as executor:
+                results = list(executor.map(self.process_cv_record, records))
+        
+        # The CVs are indexed without a refresh each; one refresh makes them all searchable
+        if any(result.get('status') == 'success' for result in results):
+            self.opensearch.flush_refresh()
+        return results
     
     def process_cv_record(self, record: Dict) -> Dict:
         """Process a single S3 CV record"""
@@ -46,7 +137,7 @@ class CVProcessor:
                 'user_id': user_id,
                 'cv_text': cv_text,
                 'cv_embedding': cv_embedding,
-                'timestamp': int(time.time() * 1000),
+                'timestamp': time.time_ns() // 1_000_000,
                 'skills_extracted': metadata['skills'],
                 'experience_years': metadata['experience_years'],
                 'job_title': metadata['job_title'],
@@ -95,11 +186,22 @@ class CVProcessor:
     def _read_cv_text_from_s3(self, bucket_name: str, object_key: str) -> str:
         """Read CV text content from S3"""
         try:
-            response = self.s3_client.get_object(Bucket=bucket_name, Key=object_key)
-            cv_text = response['Body'].read().decode('utf-8')
+            try:
+                response = self.s3_client.get_object(
+                    Bucket=bucket_name,
+                    Key=object_key,
+                    Range=f"bytes=0-{MAX_CV_BYTES - 1}"
+                )
+            except ClientError as e:
+                # S3 rejects any range on an empty object
+                if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+                    raise
+                return ""
             
-            # Clean and normalize
-            cv_text = clean_text(cv_text)
+            # Decode while reading the body, then clean and normalize. The stream reader
+            # leaves a multi-byte character cut off by the range undecoded, while still
+            # rejecting invalid UTF-8 elsewhere in the text.
+            cv_text = clean_text(codecs.getreader('utf-8')(response['Body']).read())
             
             # Limit text length (Titan has token limits)
             if len(cv_text) > 8000:
@@ -115,97 +217,39 @@ class CVProcessor:
     
     def _extract_cv_metadata(self, cv_text: str) -> Dict:
         """Extract metadata from CV text"""
+        # Lowercase once and share it between the keyword extractors
+        cv_text_lower = cv_text.lower()
         return {
-            'skills': self._extract_skills(cv_text),
-            'experience_years': self._extract_experience_years(cv_text),
+            'skills': self._extract_skills(cv_text_lower),
+            'experience_years': self._extract_experience_years(cv_text_lower),
             'job_title': self._extract_job_title(cv_text)
         }
     
-    def _extract_skills(self, cv_text: str) -> List[str]:
-        """Extract technical skills from CV"""
-        skill_keywords = [
-            # Programming Languages
-            'python', 'java', 'javascript', 'typescript', 'c++', 'c#', 'php', 'ruby',
-            'go', 'rust', 'kotlin', 'swift', 'scala', 'r', 'matlab', 'sql',
-            
-            # Web Technologies
-            'html', 'css', 'react', 'angular', 'vue', 'node.js', 'express', 'django',
-            'flask', 'spring', 'laravel', 'bootstrap', 'jquery',
-            
-            # Cloud & DevOps
-            'aws', 'azure', 'gcp', 'docker', 'kubernetes', 'jenkins', 'git',
-            'terraform', 'ansible',
-            
-            # Databases
-            'mysql', 'postgresql', 'mongodb', 'redis', 'elasticsearch', 'oracle',
-            
-            # Data Science
-            'machine learning', 'deep learning', 'tensorflow', 'pytorch',
-            'pandas', 'numpy', 'scikit-learn', 'tableau', 'power bi',
-            
-            # Design & Marketing
-            'photoshop', 'illustrator', 'figma', 'sketch', 'adobe', 'canva',
-            'seo', 'sem', 'google analytics', 'social media',
-            
-            # Business & Finance
-            'excel', 'powerpoint', 'salesforce', 'crm', 'erp', 'sap',
-            'accounting', 'finance', 'project management'
-        ]
-        
-        found_skills = []
-        cv_text_lower = cv_text.lower()
-        
-        for skill in skill_keywords:
-            # Use word boundaries for better matching
-            pattern = r'\b' + re.escape(skill.lower()) + r'\b'
-            if re.search(pattern, cv_text_lower):
-                found_skills.append(skill.title())
+    def _extract_skills(self, cv_text_lower: str) -> List[str]:
+        """Extract technical skills from lowercased CV text"""
+        # Use word boundaries for better matching
+        found_skills = [_SKILL_DISPLAY[skill] for skill in find_keywords(_SKILLS_AUTOMATON, cv_text_lower)]
         
         return found_skills[:20]  # Limit to 20 skills
     
-    def _extract_experience_years(self, cv_text: str) -> int:
-        """Extract years of experience"""
-        patterns = [
-            r'(\d+)\+?\s*years?\s*(?:of\s*)?experience',
-            r'experience\s*[:\-]?\s*(\d+)\+?\s*years?',
-            r'(\d+)\+?\s*years?\s*in\s*\w+',
-            r'(\d+)\+?\s*yrs?\s*(?:of\s*)?experience'
-        ]
-        
-        years = []
-        text_lower = cv_text.lower()
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, text_lower)
-            for match in matches:
-                try:
-                    year_val = int(match)
-                    if 0 <= year_val <= 50:  # Reasonable range
-                        years.append(year_val)
-                except ValueError:
-                    continue
-        
-        return max(years) if years else 0
+    def _extract_experience_years(self, cv_text_lower: str) -> int:
+        """Extract years of experience from lowercased CV text"""
+        # Every match captures \d+, so int() can't fail
+        years = (int(match) for pattern in _EXPERIENCE_PATTERNS for match in pattern.findall(cv_text_lower))
+        return max((year_val for year_val in years if 0 <= year_val <= 50), default=0)  # Reasonable range
     
     def _extract_job_title(self, cv_text: str) -> str:
         """Extract job title from CV"""
-        lines = cv_text.split('\n')[:15]  # Check first 15 lines
-        
-        title_keywords = [
-            'engineer', 'developer', 'manager', 'analyst', 'specialist',
-            'consultant', 'architect', 'designer', 'scientist', 'lead',
-            'director', 'coordinator', 'administrator', 'technician',
-            'representative', 'executive', 'officer', 'assistant'
-        ]
+        # maxsplit stops splitting after the lines we inspect
+        lines = cv_text.split('\n', 15)[:15]  # Check first 15 lines
         
         # Look for lines that seem like job titles
         for line in lines:
             line_clean = line.strip()
             if len(line_clean) > 5 and len(line_clean) < 100:
-                line_lower = line_clean.lower()
-                if any(keyword in line_lower for keyword in title_keywords):
+                if _TITLE_KEYWORD_PATTERN.search(line_clean):
                     # Avoid lines that are clearly not titles
-                    if not any(word in line_lower for word in ['email', 'phone', 'address', 'linkedin', 'github']):
+                    if not _NON_TITLE_PATTERN.search(line_clean):
                         return line_clean
         
         return "Not specified"
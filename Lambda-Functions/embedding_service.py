@@ -1,116 +1,200 @@
 import json
 import logging
-from typing import List
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 import boto3
+import numpy as np
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import time
+from cachetools import LRUCache
+from utils import EMBEDDING_DIMENSION
 
 logger = logging.getLogger(__name__)
 
+# Embeddings of recently seen texts, shared by every EmbeddingService in a warm container.
+# Values are float32 bytes, the same encoding as the DynamoDB cache table.
+_embedding_cache = LRUCache(maxsize=256)
+_embedding_cache_lock = threading.Lock()  # CVs can be embedded from several threads
+
+# Concurrent Bedrock requests issued by generate_embeddings
+MAX_EMBEDDING_WORKERS = 8
+
+BEDROCK_REGION = 'us-east-1'  # Titan is available in us-east-1
+
+# Created once per container so warm invocations and every EmbeddingService instance
+# share one keep-alive connection pool, sized for the concurrent batch calls
+_bedrock_client = boto3.client(
+    'bedrock-runtime',
+    region_name=BEDROCK_REGION,
+    config=Config(
+        max_pool_connections=16,
+        read_timeout=30,
+        tcp_keepalive=True,
+        # Adaptive mode retries throttling and transient errors with jittered backoff
+        # and client-side rate limiting, instead of a fixed sleep schedule
+        retries={'max_attempts': 5, 'mode': 'adaptive'}
+    )
+)
+
+# Titan models in order of preference, with the embedding size each one returns
+# (v2 is requested with 1024 dimensions, see _call_bedrock)
+_MODEL_DIMS = {
+    'amazon.titan-embed-text-v2:0': 1024,  # Latest version
+    'amazon.titan-embed-text-v1': 1536     # Fallback
+}
+
+# Bedrock error codes meaning the model itself can't be used from this account/region.
+# ValidationException is also raised for bad input, so it only counts if it names the model.
+_MODEL_UNAVAILABLE_ERRORS = frozenset(('AccessDeniedException', 'ResourceNotFoundException'))
+
+# Model currently in use by this container, kept across instances after a fallback
+_active_model = None
+_active_model_lock = threading.Lock()  # generate_embeddings calls _embed from several threads
+
 class EmbeddingService:
     def __init__(self):
-        self.region = 'us-east-1'  # Titan is available in us-east-1
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name=self.region)
+        self.region = BEDROCK_REGION
+        self.bedrock_client = _bedrock_client
         
         # Try different model IDs in order of preference
-        self.model_ids = [
-            'amazon.titan-embed-text-v2:0',  # Latest version
-            'amazon.titan-embed-text-v1'     # Fallback
-        ]
+        self.model_ids = list(_MODEL_DIMS)
+        
+        # Optional DynamoDB table (partition key "cache_key", TTL attribute "expires_at")
+        # that keeps embeddings across containers, e.g. when a CV is re-uploaded
+        self.cache_table_name = os.environ.get("EMBEDDING_CACHE_TABLE")
+        self.cache_ttl_seconds = int(os.environ.get("EMBEDDING_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+        self.cache_table = boto3.resource('dynamodb').Table(self.cache_table_name) if self.cache_table_name else None
         
         self.current_model = None
         self.embedding_dims = None
         self._initialize_model()
         
     def _initialize_model(self):
-        """Initialize and validate the embedding model"""
-        for model_id in self.model_ids:
-            try:
-                # Test the model with a simple text
-                test_response = self._call_bedrock(model_id, "test")
-                if test_response:
-                    self.current_model = model_id
-                    self.embedding_dims = len(test_response)
-                    logger.info(f"Successfully initialized model: {model_id} with {self.embedding_dims} dimensions")
-                    return
-            except Exception as e:
-                logger.warning(f"Failed to initialize model {model_id}: {str(e)}")
-                continue
-        
-        # If all models fail
-        logger.error("Failed to initialize any Titan embedding model")
-        raise Exception("No Titan embedding model available")
+        """Select the embedding model without calling Bedrock"""
+        # The dimensions of each model are known, so no probe request is needed. A model
+        # that turns out to be unavailable is replaced on its first call (see _embed).
+        self.current_model = _active_model or self.model_ids[0]
+        self.embedding_dims = _MODEL_DIMS[self.current_model]
+        logger.info(f"Using embedding model: {self.current_model} with {self.embedding_dims} dimensions")
+    
+    @staticmethod
+    def _is_model_unavailable(error: ClientError, model_id: str) -> bool:
+        """Check whether a Bedrock error is about the model itself rather than the request"""
+        error = error.response.get('Error', {})
+        if error.get('Code') in _MODEL_UNAVAILABLE_ERRORS:
+            return True
+        message = error.get('Message', '').lower()
+        return error.get('Code') == 'ValidationException' and (model_id in message or 'model identifier' in message)
     
-    def _call_bedrock(self, model_id: str, text: str, max_retries: int = 3) -> List[float]:
-        """Call Bedrock API with retry logic and enhanced debugging"""
-        for attempt in range(max_retries):
+    def _fallback_model(self, model_id: str) -> Optional[str]:
+        """Get the next model after model_id whose embeddings fit the k-NN mapping"""
+        position = self.model_ids.index(model_id)
+        return next((m for m in self.model_ids[position + 1:] if _MODEL_DIMS[m] == EMBEDDING_DIMENSION), None)
+    
+    def _embed(self, text: str, model_id: str) -> Tuple[np.ndarray, str]:
+        """Call the given model, falling back to the next one if it is unavailable; returns the model used"""
+        global _active_model
+        while True:
             try:
-                # Prepare request based on model version
-                if 'v2' in model_id:
-                    request_body = {
-                        "inputText": text,
-                        "dimensions": 1024,  # v2 supports different dimensions
-                        "normalize": True
-                    }
-                else:
-                    request_body = {
-                        "inputText": text
-                    }
-                
-                logger.debug(f"Bedrock request for model {model_id}: {json.dumps(request_body, default=str)[:200]}")
-                
-                # Call Bedrock API
-                response = self.bedrock_client.invoke_model(
-                    modelId=model_id,
-                    body=json.dumps(request_body),
-                    contentType='application/json',
-                    accept='application/json'
-                )
-                
-                # Parse response
-                response_body = json.loads(response['body'].read())
-                logger.debug(f"Bedrock response keys: {list(response_body.keys())}")
+                return self._call_bedrock(model_id, text), model_id
+            except ClientError as e:
+                if not self._is_model_unavailable(e, model_id):
+                    raise
                 
-                embedding = response_body.get('embedding')
+                fallback_model = self._fallback_model(model_id)
+                if fallback_model is None:
+                    logger.error(f"No Titan embedding model with {EMBEDDING_DIMENSION} dimensions available")
+                    raise
                 
-                # Enhanced validation with detailed logging
-                if embedding is None:
-                    logger.error(f"Bedrock returned None embedding. Full response: {response_body}")
-                    raise ValueError("Bedrock returned None embedding")
-                
-                if not isinstance(embedding, list):
-                    logger.error(f"Embedding is not a list: {type(embedding)}")
-                    raise ValueError(f"Embedding is not a list: {type(embedding)}")
-                
-                if len(embedding) == 0:
-                    logger.error("Embedding is empty list")
-                    raise ValueError("Embedding is empty list")
-                
-                # Check for None values in the embedding
-                none_indices = [i for i, val in enumerate(embedding) if val is None]
-                if none_indices:
-                    logger.error(f"Embedding contains None values at indices: {none_indices[:10]}...")
-                    raise ValueError(f"Embedding contains {len(none_indices)} None values")
-                
-                # Check for non-numeric values
-                non_numeric_indices = [i for i, val in enumerate(embedding) if not isinstance(val, (int, float))]
-                if non_numeric_indices:
-                    logger.error(f"Embedding contains non-numeric values at indices: {non_numeric_indices[:10]}...")
-                    raise ValueError(f"Embedding contains {len(non_numeric_indices)} non-numeric values")
-                
-                logger.debug(f"Generated valid embedding with {len(embedding)} dimensions using {model_id}")
-                logger.debug(f"Sample embedding values: {embedding[:5]} ... {embedding[-5:]}")
-                return embedding
-                
-            except Exception as e:
-                logger.warning(f"Attempt {attempt + 1} failed for model {model_id}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    logger.error(f"All attempts failed for model {model_id}")
-                    raise e
+                logger.warning(f"Model {model_id} unavailable ({e.response.get('Error', {}).get('Code')}), falling back")
+                model_id = fallback_model
+                with _active_model_lock:
+                    self.current_model = model_id
+                    self.embedding_dims = _MODEL_DIMS[model_id]
+                    _active_model = model_id
     
-    def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for given text with enhanced debugging"""
+    def _call_bedrock(self, model_id: str, text: str) -> np.ndarray:
+        """Call Bedrock API with enhanced debugging (retries are handled by the client)"""
+        try:
+            # Prepare request based on model version
+            if 'v2' in model_id:
+                request_body = {
+                    "inputText": text,
+                    "dimensions": 1024,  # v2 supports different dimensions
+                    "normalize": True
+                }
+            else:
+                request_body = {
+                    "inputText": text
+                }
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Bedrock request for model %s: %s", model_id, json.dumps(request_body, default=str)[:200])
+            
+            # Call Bedrock API
+            response = self.bedrock_client.invoke_model(
+                modelId=model_id,
+                body=json.dumps(request_body),
+                contentType='application/json',
+                accept='application/json'
+            )
+            
+            # Parse response
+            response_body = json.loads(response['body'].read())
+            logger.debug("Bedrock response keys: %s", response_body.keys())
+            
+            embedding = response_body.get('embedding')
+            
+            # Enhanced validation with detailed logging
+            if embedding is None:
+                logger.error(f"Bedrock returned None embedding. Full response: {response_body}")
+                raise ValueError("Bedrock returned None embedding")
+            
+            embedding = self._validate_embedding(embedding, _MODEL_DIMS[model_id])
+            
+            logger.debug("Generated valid embedding with %d dimensions using %s", embedding.size, model_id)
+            # Slices of the array are views, nothing is copied unless the record is emitted
+            logger.debug("Sample embedding values: %s ... %s", embedding[:5], embedding[-5:])
+            return embedding
+            
+        except Exception as e:
+            logger.error(f"Bedrock call failed for model {model_id}: {str(e)}")
+            raise e
+    
+    def _validate_embedding(self, embedding, expected_dims: int) -> np.ndarray:
+        """Validate a raw embedding in one pass and return it as a float32 array"""
+        if not isinstance(embedding, list):
+            logger.error(f"Embedding is not a list: {type(embedding)}")
+            raise ValueError(f"Embedding is not a list: {type(embedding)}")
+        
+        # None values become NaN and are caught by the finiteness check below
+        try:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        except (TypeError, ValueError):
+            logger.error("Embedding contains non-numeric values")
+            raise ValueError("Embedding contains non-numeric values")
+        
+        if embedding.ndim != 1 or embedding.size == 0:
+            logger.error(f"Embedding has invalid shape: {embedding.shape}")
+            raise ValueError(f"Embedding has invalid shape: {embedding.shape}")
+        
+        if not np.isfinite(embedding).all():
+            invalid_count = embedding.size - int(np.isfinite(embedding).sum())
+            logger.error(f"Embedding contains {invalid_count} None or non-finite values")
+            raise ValueError(f"Embedding contains {invalid_count} None or non-finite values")
+        
+        # Check dimensions match expected
+        if embedding.size != expected_dims:
+            logger.warning(f"Embedding dimension mismatch: got {embedding.size}, expected {expected_dims}")
+        
+        return embedding
+    
+    def generate_embedding(self, text: str, use_cache: bool = True) -> List[float]:
+        """Generate embedding for given text with enhanced debugging (use_cache=False always calls Bedrock)"""
         try:
             if not text or len(text.strip()) < 5:
                 raise ValueError("Text too short for embedding generation")
@@ -124,48 +208,93 @@ class EmbeddingService:
                 logger.warning("Text truncated for embedding generation")
             
             logger.info(f"Generating embedding for text length: {len(text)} characters")
-            logger.debug(f"Text preview: {text[:100]}...")
-            
-            # Generate embedding using current model
-            embedding = self._call_bedrock(self.current_model, text)
-            
-            # Final validation before returning
-            if not embedding:
-                logger.error("Final embedding validation failed: embedding is falsy")
-                raise ValueError("Generated embedding is falsy")
-            
-            if not isinstance(embedding, list):
-                logger.error(f"Final embedding validation failed: not a list, type={type(embedding)}")
-                raise ValueError(f"Generated embedding is not a list: {type(embedding)}")
+            logger.debug("Text preview: %.100s...", text)
             
-            if len(embedding) == 0:
-                logger.error("Final embedding validation failed: empty list")
-                raise ValueError("Generated embedding is empty")
+            # Read once, other threads may switch the shared instance to a fallback model
+            model_id = self.current_model
             
-            # Check dimensions match expected
-            if self.embedding_dims and len(embedding) != self.embedding_dims:
-                logger.warning(f"Embedding dimension mismatch: got {len(embedding)}, expected {self.embedding_dims}")
+            if use_cache:
+                cache_key = self._cache_key(text, model_id)
+                cached = self._get_cached_embedding(cache_key)
+                if cached is not None:
+                    logger.info(f"Using cached embedding with {len(cached)} dimensions")
+                    return cached
             
-            # Final check for None values
-            if any(val is None for val in embedding):
-                none_count = sum(1 for val in embedding if val is None)
-                logger.error(f"Final validation failed: {none_count} None values in embedding")
-                raise ValueError(f"Generated embedding contains {none_count} None values")
-            
-            # Final check for non-numeric values
-            non_numeric_vals = [val for val in embedding if not isinstance(val, (int, float))]
-            if non_numeric_vals:
-                logger.error(f"Final validation failed: non-numeric values: {non_numeric_vals[:5]}")
-                raise ValueError(f"Generated embedding contains non-numeric values")
+            # Generate embedding using current model
+            embedding, used_model = self._embed(text, model_id)
             
             logger.info(f"Successfully generated and validated embedding with {len(embedding)} dimensions")
-            return embedding
+            if use_cache:
+                if used_model != model_id:
+                    cache_key = self._cache_key(text, used_model)  # Fell back to another model
+                self._cache_embedding(cache_key, embedding)
+            # Plain floats only at the boundary, for the JSON documents sent to OpenSearch
+            return embedding.tolist()
             
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             logger.error(f"Text that caused error (first 200 chars): {text[:200] if text else 'None'}")
             raise e
     
+    def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Generate embeddings for several texts concurrently, in input order (None where a text failed)"""
+        # Identical texts are embedded once; cached ones never reach Bedrock
+        unique_texts = list(dict.fromkeys(texts))
+        
+        def embed(text):
+            try:
+                return self.generate_embedding(text)
+            except Exception:
+                return None  # Already logged by generate_embedding
+        
+        if len(unique_texts) <= 1:
+            embeddings = [embed(text) for text in unique_texts]
+        else:
+            with ThreadPoolExecutor(max_workers=min(MAX_EMBEDDING_WORKERS, len(unique_texts))) as executor:
+                embeddings = list(executor.map(embed, unique_texts))
+        
+        by_text = dict(zip(unique_texts, embeddings))
+        return [by_text[text] for text in texts]
+    
+    def _cache_key(self, text: str, model_id: str) -> str:
+        """Build the cache key for a text, partitioned by model and embedding size"""
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{model_id}:{_MODEL_DIMS[model_id]}:{digest}"
+    
+    def _get_cached_embedding(self, cache_key: str) -> Optional[List[float]]:
+        """Look up an embedding in the in-process cache, then in the DynamoDB table"""
+        with _embedding_cache_lock:
+            data = _embedding_cache.get(cache_key)
+        if data is None and self.cache_table is not None:
+            try:
+                item = self.cache_table.get_item(Key={'cache_key': cache_key}).get('Item')
+                if item:
+                    data = bytes(item['embedding'])
+                    with _embedding_cache_lock:
+                        _embedding_cache[cache_key] = data
+            except Exception as e:
+                logger.warning(f"Error reading embedding cache: {str(e)}")
+        
+        if data is None:
+            return None
+        return np.frombuffer(data, dtype=np.float32).tolist()
+    
+    def _cache_embedding(self, cache_key: str, embedding: np.ndarray):
+        """Store an embedding in the in-process cache and the DynamoDB table"""
+        data = embedding.tobytes()
+        with _embedding_cache_lock:
+            _embedding_cache[cache_key] = data
+        if self.cache_table is None:
+            return
+        try:
+            self.cache_table.put_item(Item={
+                'cache_key': cache_key,
+                'embedding': data,
+                'expires_at': int(time.time()) + self.cache_ttl_seconds
+            })
+        except Exception as e:
+            logger.warning(f"Error writing embedding cache: {str(e)}")
+    
     def get_model_info(self) -> dict:
         """Get information about the current model"""
         return {
@@ -187,16 +316,17 @@ class EmbeddingService:
             results = []
             for i, test_text in enumerate(test_texts):
                 try:
-                    embedding = self.generate_embedding(test_text)
+                    # Bypass the cache, otherwise a Bedrock outage would go unnoticed
+                    embedding = np.asarray(self.generate_embedding(test_text, use_cache=False), dtype=np.float32)
                     
                     results.append({
                         'test_case': i + 1,
                         'text_length': len(test_text),
                         'embedding_dimensions': len(embedding),
-                        'has_nulls': any(val is None for val in embedding),
-                        'all_numeric': all(isinstance(val, (int, float)) for val in embedding),
-                        'min_value': min(embedding),
-                        'max_value': max(embedding),
+                        'has_nulls': bool(np.isnan(embedding).any()),
+                        'all_numeric': bool(np.isfinite(embedding).all()),
+                        'min_value': float(embedding.min()),
+                        'max_value': float(embedding.max()),
                         'status': 'success'
                     })
                 except Exception as e:
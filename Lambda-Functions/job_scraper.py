@@ -3,19 +3,112 @@ import logging
 import time
 import re
 import hashlib
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 import requests
-from bs4 import BeautifulSoup
-from opensearch_manager import OpenSearchManager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.html
+import soupsieve
+from bs4 import BeautifulSoup, Tag
+from lxml.cssselect import CSSSelector
+from opensearch_manager import OpenSearchManager, get_manager
 from embedding_service import EmbeddingService
-from utils import clean_text
+from utils import clean_text, build_keyword_automaton, find_keywords
 
 logger = logging.getLogger(__name__)
 
+JOBS_PER_PAGE = 15  # Wuzzuf typically shows 15 jobs per page
+MAX_PAGES = 3  # Max 3 pages per search
+MAX_FETCH_WORKERS = 4  # Concurrent page requests to Wuzzuf
+
+# Searches run by scrape_and_embed_jobs, based on current Wuzzuf structure
+SEARCH_URLS = [
+    "https://wuzzuf.net/search/jobs/?a=hpb&q=software%20engineer",
+    "https://wuzzuf.net/search/jobs/?a=hpb&q=developer",
+    "https://wuzzuf.net/search/jobs/?a=hpb&q=data%20analyst",
+    "https://wuzzuf.net/search/jobs/?a=hpb&q=marketing",
+    "https://wuzzuf.net/search/jobs/?a=hpb&q=sales"
+]
+
+JOB_SKILL_KEYWORDS = (
+    # Programming languages
+    'python', 'java', 'javascript', 'typescript', 'c++', 'c#', 'php', 'ruby', 'go', 'kotlin', 'swift',
+    # Web technologies
+    'html', 'css', 'react', 'angular', 'vue', 'node.js', 'express', 'django', 'flask',
+    # Databases
+    'sql', 'mysql', 'postgresql', 'mongodb', 'redis', 'oracle',
+    # Cloud/DevOps
+    'aws', 'azure', 'gcp', 'docker', 'kubernetes', 'jenkins', 'git',
+    # Data/Analytics
+    'excel', 'power bi', 'tableau', 'analytics', 'data'
+)
+
+# Other spellings of a skill, reported under its name in JOB_SKILL_KEYWORDS
+_JOB_SKILL_VARIANTS = {'nodejs': 'node.js', 'powerbi': 'power bi'}
+_JOB_SKILL_NAMES = {**{skill: skill for skill in JOB_SKILL_KEYWORDS}, **_JOB_SKILL_VARIANTS}
+
+# Aho-Corasick automaton over all skills, so a description is scanned once
+_JOB_SKILLS_AUTOMATON = build_keyword_automaton(_JOB_SKILL_NAMES)
+
+# Cards found by the lxml fast path; other page layouts go through BeautifulSoup
+_LXML_JOB_CARD_SELECTOR = CSSSelector('div[data-testid="job-card"]')
+
+# Job card fields, each found with one selector compiled at import instead of a
+# select_one() per alternative on every card. Matches come in document order.
+# Every selector is compiled for BeautifulSoup tags and for lxml elements.
+_CARD_FIELD_SELECTORS = {
+    field: (soupsieve.compile(selector), CSSSelector(selector))
+    for field, selector in {
+        'title': 'h2 a, h3 a, a[data-testid="job-title"], .css-o171kl, .css-17s97q8',
+        'company': '[data-testid="job-company"], .css-1gatmva a, .css-17s97q8',
+        'description': '[data-testid="job-description"], .css-y4udm8, .css-1ubo9m8, p, .job-description'
+    }.items()
+}
+_TITLE_LINK_PATTERN = re.compile('engineer|developer')
+
+# Texts shorter than this (after cleaning) are not embedded
+MIN_EMBEDDING_TEXT_LENGTH = 20
+
+# The scheduled scrape sees the same listings run after run, so cleaned texts are kept
+# for the warm container; CV texts are not cached, they are large and rarely repeat
+_clean_job_text = lru_cache(maxsize=1024)(clean_text)
+
+# Experience keywords are matched anywhere in the text, like the substring checks they replace
+_SENIOR_PATTERN = re.compile('|'.join(map(re.escape, ['senior', 'lead', 'principal', '5+', '3+', 'experienced', 'expert'])))
+_JUNIOR_PATTERN = re.compile('|'.join(map(re.escape, ['junior', 'entry', 'graduate', 'intern', 'fresh', '0-2', 'trainee'])))
+
+def _select(card, field: str):
+    """Iterate over the elements matching a field's selector in a BeautifulSoup or lxml card"""
+    soup_selector, lxml_selector = _CARD_FIELD_SELECTORS[field]
+    return soup_selector.iselect(card) if isinstance(card, Tag) else iter(lxml_selector(card))
+
+def _descendants(card, tag: str):
+    """Iterate over a card's descendant elements with the given tag name"""
+    return iter(card.find_all(tag)) if isinstance(card, Tag) else card.iterdescendants(tag)
+
+def _text(element) -> str:
+    """Text of an element, with every string stripped like BeautifulSoup's get_text(strip=True)"""
+    if isinstance(element, Tag):
+        return element.get_text(strip=True)
+    return ''.join(text.strip() for text in element.xpath('.//text()'))
+
+def _page_encoding(response) -> str:
+    """Charset declared in the response's Content-Type header, otherwise utf-8"""
+    # Not response.encoding: requests reports ISO-8859-1 for any text/html response
+    # without a charset, which would garble the Arabic text on UTF-8 Wuzzuf pages
+    _, _, params = response.headers.get('Content-Type', '').partition(';')
+    for param in params.split(';'):
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset' and value.strip(' "\''):
+            return value.strip(' "\'')
+    return 'utf-8'
+
 class JobScraper:
     def __init__(self):
-        self.opensearch = OpenSearchManager()
-        self.embedding_service = EmbeddingService()
         self.base_url = "https://wuzzuf.net"
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -29,65 +122,53 @@ class JobScraper:
             'Sec-Fetch-Site': 'none',
             'Sec-Fetch-User': '?1'
         }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+    
+    # The clients are built on first use, so creating a JobScraper (e.g. during a Lambda
+    # cold start) doesn't pay for those a code path never reaches
+    @cached_property
+    def opensearch(self) -> OpenSearchManager:
+        """OpenSearch manager used to look up and index jobs"""
+        return get_manager()
+    
+    @cached_property
+    def embedding_service(self) -> EmbeddingService:
+        """Embedding service used for the job texts"""
+        return EmbeddingService()
+    
+    @cached_property
+    def session(self) -> requests.Session:
+        """HTTP session used to fetch Wuzzuf pages"""
+        session = requests.Session()
+        session.headers.update(self.headers)
+        
+        # Enough pooled keep-alive connections for the concurrent page fetches, with
+        # backoff on rate limiting and server errors instead of failing the page
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"]
+            )
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
     
     def scrape_small_batch(self, max_jobs: int = 10) -> Dict:
         """Scrape a small batch of jobs for testing purposes"""
         try:
             logger.info(f"Starting small batch scraping (max {max_jobs} jobs)")
             
-            # Use only one search URL for testing
+            # Use only one search URL for testing, and process only its first 5 jobs
             test_url = "https://wuzzuf.net/search/jobs/?a=hpb&q=software%20engineer"
-            
-            jobs = self._scrape_from_url(test_url, max_jobs)
-            logger.info(f"Scraped {len(jobs)} jobs from test URL")
-            
-            # Process a smaller subset for testing
-            processed_jobs = []
-            embedding_success = 0
-            embedding_failures = 0
-            
-            for job in jobs[:5]:  # Process only first 5 jobs
-                try:
-                    processed_job = self._process_and_embed_job(job)
-                    if processed_job:
-                        processed_jobs.append(processed_job)
-                        
-                        # Track embedding success
-                        if processed_job.get('embedding_status') == 'success':
-                            embedding_success += 1
-                        else:
-                            embedding_failures += 1
-                        
-                        # Store in OpenSearch
-                        result = self.opensearch.index_job_document(processed_job['job_id'], processed_job)
-                        logger.info(f"Indexed job {processed_job['job_id']}: {result.get('result', 'unknown')}")
-                        
-                except Exception as e:
-                    logger.error(f"Error processing job in small batch: {str(e)}")
-                    embedding_failures += 1
-                    continue
-            
-            return {
-                'total_scraped': len(jobs),
-                'successfully_processed': len(processed_jobs),
-                'embedding_success': embedding_success,
-                'embedding_failures': embedding_failures,
-                'processed_job_ids': [job['job_id'] for job in processed_jobs],
-                'status': 'success'
-            }
+            return self._run([(test_url, max_jobs)], max_processed=5)
             
         except Exception as e:
             logger.error(f"Error in scrape_small_batch: {str(e)}")
-            return {
-                'total_scraped': 0,
-                'successfully_processed': 0,
-                'embedding_success': 0,
-                'embedding_failures': 1,
-                'error': str(e),
-                'status': 'failed'
-            }
+            return self._failed_result(e)
     
     def run_scheduled_scrape(self) -> Dict:
         """Run the scheduled scraping process for CloudWatch Events"""
@@ -102,123 +183,202 @@ class JobScraper:
             
         except Exception as e:
             logger.error(f"Error in scheduled scraping: {str(e)}")
-            return {
-                'total_scraped': 0,
-                'successfully_processed': 0,
-                'embedding_success': 0,
-                'embedding_failures': 1,
-                'error': str(e),
-                'status': 'failed'
-            }
+            return self._failed_result(e)
     
     def scrape_and_embed_jobs(self, max_jobs: int = 50) -> Dict:
         """Main function to scrape jobs and create embeddings"""
         try:
             logger.info(f"Starting job scraping (max {max_jobs} jobs)")
             
-            # Updated URLs based on current Wuzzuf structure
-            search_urls = [
-                "https://wuzzuf.net/search/jobs/?a=hpb&q=software%20engineer",
-                "https://wuzzuf.net/search/jobs/?a=hpb&q=developer",
-                "https://wuzzuf.net/search/jobs/?a=hpb&q=data%20analyst",
-                "https://wuzzuf.net/search/jobs/?a=hpb&q=marketing",
-                "https://wuzzuf.net/search/jobs/?a=hpb&q=sales"
-            ]
-            
-            all_jobs = []
-            jobs_per_search = max_jobs // len(search_urls)
-            
-            for i, url in enumerate(search_urls):
-                try:
-                    search_term = url.split('q=')[1].replace('%20', ' ')
-                    logger.info(f"Scraping jobs for: {search_term}")
-                    
-                    jobs = self._scrape_from_url(url, jobs_per_search)
-                    all_jobs.extend(jobs)
-                    logger.info(f"Scraped {len(jobs)} jobs for '{search_term}'")
-                    
-                    # Rate limiting
-                    time.sleep(3)
-                    
-                except Exception as e:
-                    logger.error(f"Error scraping URL {url}: {str(e)}")
-                    continue
-            
-            # Process and embed jobs
-            processed_jobs = []
-            embedding_success = 0
-            embedding_failures = 0
-            
-            for job in all_jobs:
-                try:
-                    processed_job = self._process_and_embed_job(job)
-                    if processed_job:
-                        processed_jobs.append(processed_job)
-                        
-                        # Track embedding success
-                        if processed_job.get('embedding_status') == 'success':
-                            embedding_success += 1
-                        else:
-                            embedding_failures += 1
-                        
-                        # Store in OpenSearch
-                        self.opensearch.index_job_document(processed_job['job_id'], processed_job)
-                        
-                except Exception as e:
-                    logger.error(f"Error processing job: {str(e)}")
-                    embedding_failures += 1
-                    continue
-            
-            logger.info(f"Successfully processed {len(processed_jobs)} jobs")
-            logger.info(f"Embedding success: {embedding_success}, failures: {embedding_failures}")
-            
-            return {
-                'total_scraped': len(all_jobs),
-                'successfully_processed': len(processed_jobs),
-                'embedding_success': embedding_success,
-                'embedding_failures': embedding_failures,
-                'search_terms': [url.split('q=')[1].replace('%20', ' ') for url in search_urls],
-                'status': 'success'
-            }
+            jobs_per_search = max_jobs // len(SEARCH_URLS)
+            result = self._run([(url, jobs_per_search) for url in SEARCH_URLS])
+            result['search_terms'] = [self._search_term(url) for url in SEARCH_URLS]
+            return result
             
         except Exception as e:
             logger.error(f"Error in scrape_and_embed_jobs: {str(e)}")
             raise e
     
-    def _scrape_from_url(self, url: str, max_jobs: int) -> List[Dict]:
-        """Scrape jobs from a specific URL"""
+    def _run(self, searches: List[Tuple[str, int]], max_processed: Optional[int] = None) -> Dict:
+        """Scrape the (url, max_jobs) searches, then process, embed and bulk index their jobs"""
+        # Pages of all searches are fetched together
+        results = self._scrape_from_urls(searches)
+        
+        all_jobs = []
+        for (url, _), jobs in zip(searches, results):
+            all_jobs.extend(jobs)
+            logger.info(f"Scraped {len(jobs)} jobs for '{self._search_term(url)}'")
+        
+        # A listing found by several searches is processed once (job ids are content based)
+        unique_jobs = {}
+        for job in all_jobs:
+            unique_jobs.setdefault(job['job_id'], job)
+        unique_jobs = list(unique_jobs.values())
+        duplicates_skipped = len(all_jobs) - len(unique_jobs)
+        if duplicates_skipped:
+            logger.info(f"Skipping {duplicates_skipped} duplicate jobs found by more than one search")
+        
+        # Process and embed jobs
+        processed_jobs = self._process_and_embed_jobs(unique_jobs[:max_processed])
+        
+        # Track embedding success
+        embedding_success = sum(1 for job in processed_jobs if job.get('embedding_status') == 'success')
+        embedding_cached = sum(1 for job in processed_jobs if job.get('embedding_status') == 'cached')
+        embedding_failures = len(processed_jobs) - embedding_success - embedding_cached
+        
+        # Store in OpenSearch in a single bulk request. Cached jobs are left as they
+        # are: the vector isn't kept in _source, so rewriting them would drop it.
+        to_index = [job for job in processed_jobs if job.get('embedding_status') != 'cached']
+        try:
+            bulk_result = self.opensearch.bulk_index_job_documents(to_index)
+            indexed = bulk_result['indexed']
+            failed_ids = {error.get('index', {}).get('_id') for error in bulk_result['errors']}
+            index_errors = len(bulk_result['errors'])
+        except Exception as e:
+            logger.error(f"Error bulk indexing jobs: {str(e)}")
+            indexed = 0
+            failed_ids = {job['job_id'] for job in to_index}
+            index_errors = len(to_index)
+        
+        if not index_errors:
+            status = 'success'
+        elif indexed or embedding_cached:
+            status = 'partial_success'
+        else:
+            status = 'failed'
+        
+        logger.info(f"Successfully processed {len(processed_jobs)} jobs")
+        logger.info(f"Embedding success: {embedding_success}, failures: {embedding_failures}, cached: {embedding_cached}")
+        logger.info(f"Indexed: {indexed}, index errors: {index_errors}")
+        
+        return {
+            'total_scraped': len(all_jobs),
+            'successfully_processed': len(processed_jobs),
+            'embedding_success': embedding_success,
+            'embedding_failures': embedding_failures,
+            'embedding_cached': embedding_cached,
+            'duplicates_skipped': duplicates_skipped,
+            'indexed': indexed,
+            'index_errors': index_errors,
+            # Jobs now in the index: written by this run or already indexed with the same text
+            'processed_job_ids': [job['job_id'] for job in processed_jobs if job['job_id'] not in failed_ids],
+            'status': status
+        }
+    
+    def _failed_result(self, error: Exception) -> Dict:
+        """Result returned when a scrape fails, with the same counts as a successful one"""
+        return {
+            'total_scraped': 0,
+            'successfully_processed': 0,
+            'embedding_success': 0,
+            'embedding_failures': 1,
+            'error': str(error),
+            'status': 'failed'
+        }
+    
+    def _search_term(self, url: str) -> str:
+        """Get the search term of a Wuzzuf search URL"""
+        return url.split('q=')[1].replace('%20', ' ')
+    
+    def _scrape_from_urls(self, searches: List[Tuple[str, int]]) -> List[List[Dict]]:
+        """Scrape jobs for several (url, max_jobs) searches, fetching their pages concurrently"""
+        # Prefetch the pages each search is expected to need in one batch. The bounded
+        # pool caps concurrent requests to Wuzzuf in place of fixed sleeps between pages.
+        page_urls = [
+            self._page_url(url, page)
+            for url, max_jobs in searches
+            for page in range(min(MAX_PAGES, -(-max_jobs // JOBS_PER_PAGE)))
+        ]
+        # Touch the cached_property here: the first workers would otherwise race to
+        # create it, and each build a session with its own connection pool
+        _ = self.session
+        
+        # Each worker parses its page as soon as it arrives, overlapping with the
+        # other fetches; lxml releases the GIL while it builds the tree
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+            pages = dict(zip(page_urls, executor.map(self._fetch_and_parse_page, page_urls)))
+        
+        return [self._collect_jobs(url, max_jobs, pages) for url, max_jobs in searches]
+    
+    def _collect_jobs(self, url: str, max_jobs: int, pages: Dict[str, Optional[List[Dict]]]) -> List[Dict]:
+        """Gather a search's jobs from its parsed pages in order, scraping any page that wasn't prefetched"""
         jobs = []
         page = 0
         
-        while len(jobs) < max_jobs and page < 3:  # Max 3 pages per search
-            try:
-                # Add page parameter
-                page_url = f"{url}&start={page * 15}"  # Wuzzuf typically shows 15 jobs per page
-                logger.info(f"Fetching: {page_url}")
-                
-                response = self.session.get(page_url, timeout=30)
-                
-                if response.status_code != 200:
-                    logger.warning(f"Failed to fetch {page_url} - Status: {response.status_code}")
-                    break
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                page_jobs = self._parse_jobs_from_page(soup)
-                
-                if not page_jobs:
-                    logger.info(f"No jobs found on page {page}")
-                    break
-                
-                jobs.extend(page_jobs)
-                page += 1
-                time.sleep(2)  # Rate limiting between pages
-                
-            except Exception as e:
-                logger.error(f"Error scraping page {page}: {str(e)}")
+        while len(jobs) < max_jobs and page < MAX_PAGES:
+            page_url = self._page_url(url, page)
+            page_jobs = pages[page_url] if page_url in pages else self._fetch_and_parse_page(page_url)
+            if page_jobs is None:
+                break
+            
+            if not page_jobs:
+                logger.info(f"No jobs found on page {page}")
                 break
+            
+            jobs.extend(page_jobs)
+            page += 1
         
         return jobs[:max_jobs]
     
+    def _page_url(self, url: str, page: int) -> str:
+        """Add the page parameter to a search URL"""
+        return f"{url}&start={page * JOBS_PER_PAGE}"
+    
+    def _fetch_and_parse_page(self, page_url: str) -> Optional[List[Dict]]:
+        """Fetch and parse one results page, returning None if it could not be scraped"""
+        response = self._fetch_page(page_url)
+        if response is None:
+            return None
+        
+        try:
+            return self._parse_page(response)
+        except Exception as e:
+            logger.error(f"Error scraping page {page_url}: {str(e)}")
+            return None
+    
+    def _fetch_page(self, page_url: str) -> Optional[requests.Response]:
+        """Fetch one results page, returning None if it could not be fetched"""
+        try:
+            logger.info(f"Fetching: {page_url}")
+            response = self.session.get(page_url, timeout=30)
+            
+            if response.status_code != 200:
+                logger.warning(f"Failed to fetch {page_url} - Status: {response.status_code}")
+                return None
+            return response
+            
+        except Exception as e:
+            logger.error(f"Error fetching {page_url}: {str(e)}")
+            return None
+    
+    def _parse_page(self, response) -> List[Dict]:
+        """Parse job listings from a page, building a BeautifulSoup tree only if lxml finds no job cards"""
+        # lxml builds its tree in C and extracts the cards with compiled XPath, much
+        # cheaper than BeautifulSoup's Python objects for the usual page layout.
+        # The bytes are decoded with the charset declared in the headers, else as UTF-8.
+        encoding = _page_encoding(response)
+        try:
+            parser = lxml.html.HTMLParser(encoding=encoding, remove_blank_text=True)
+            job_cards = _LXML_JOB_CARD_SELECTOR(lxml.html.fromstring(response.content, parser=parser))
+        except Exception as e:
+            logger.warning(f"lxml fast path failed to parse page: {str(e)}")
+            job_cards = []
+        
+        if not job_cards:
+            return self._parse_jobs_from_page(self._parse_html(response, encoding))
+        
+        logger.info(f"Found {len(job_cards)} job cards with the lxml fast path")
+        return self._extract_jobs_from_cards(job_cards)
+    
+    def _parse_html(self, response, encoding: str) -> BeautifulSoup:
+        """Parse a page with the C-backed lxml parser, falling back to html.parser"""
+        # Passing the encoding (see _page_encoding) skips charset detection
+        try:
+            return BeautifulSoup(response.content, 'lxml', from_encoding=encoding)
+        except Exception as e:
+            logger.warning(f"lxml failed to parse page, falling back to html.parser: {str(e)}")
+            return BeautifulSoup(response.content, 'html.parser', from_encoding=encoding)
+    
     def _parse_jobs_from_page(self, soup) -> List[Dict]:
         """Parse job listings from a page - Updated selectors"""
         jobs = []
@@ -252,6 +412,11 @@ class JobScraper:
             job_cards = soup.find_all('div', string=re.compile(r'.*(engineer|developer|analyst|manager).*', re.I))
             logger.info(f"Fallback: Found {len(job_cards)} potential job containers")
         
+        return self._extract_jobs_from_cards(job_cards)
+    
+    def _extract_jobs_from_cards(self, job_cards) -> List[Dict]:
+        """Extract the jobs from a page's job cards"""
+        jobs = []
         for card in job_cards[:20]:  # Limit to avoid too much processing
             try:
                 job = self._extract_job_from_card(card)
@@ -265,31 +430,23 @@ class JobScraper:
         return jobs
     
     def _extract_job_from_card(self, card) -> Dict:
-        """Extract job details from a job card - More flexible extraction"""
+        """Extract job details from a job card (a BeautifulSoup tag or an lxml element) - More flexible extraction"""
         try:
-            # Try to find title
+            # Try to find title; the :contains() checks are done on the link text
+            # since Soup Sieve has deprecated that pseudo-class
             title = None
-            title_selectors = [
-                'h2 a', 'h3 a', 'a[data-testid="job-title"]',
-                '.css-o171kl', '.css-17s97q8',
-                'a:contains("engineer")', 'a:contains("developer")'
-            ]
-            
-            for selector in title_selectors:
-                try:
-                    title_elem = card.select_one(selector)
-                    if title_elem:
-                        title = title_elem.get_text(strip=True)
-                        job_url = title_elem.get('href', '')
-                        break
-                except:
-                    continue
+            title_elem = next(_select(card, 'title'), None)
+            if title_elem is None:
+                title_elem = next((link for link in _descendants(card, 'a') if _TITLE_LINK_PATTERN.search(_text(link))), None)
+            if title_elem is not None:
+                title = _text(title_elem)
+                job_url = title_elem.get('href', '')
             
             if not title:
                 # Fallback: any link in the card
-                link = card.find('a')
-                if link:
-                    title = link.get_text(strip=True)
+                link = next(_descendants(card, 'a'), None)
+                if link is not None:
+                    title = _text(link)
                     job_url = link.get('href', '')
             
             if not title:
@@ -299,43 +456,22 @@ class JobScraper:
             if job_url and job_url.startswith('/'):
                 job_url = self.base_url + job_url
             
-            # Try to find company
+            # Try to find company, then spans mentioning "Company" and divs containing "at"
             company = "Unknown Company"
-            company_selectors = [
-                '[data-testid="job-company"]',
-                '.css-1gatmva a', '.css-17s97q8',
-                'span:contains("Company")',
-                'div:contains("at")'
-            ]
-            
-            for selector in company_selectors:
-                try:
-                    company_elem = card.select_one(selector)
-                    if company_elem:
-                        company_text = company_elem.get_text(strip=True)
-                        if company_text and len(company_text) < 100:
-                            company = company_text
-                            break
-                except:
-                    continue
+            company_elems = chain(
+                _select(card, 'company'),
+                (span for span in _descendants(card, 'span') if 'Company' in _text(span)),
+                (div for div in _descendants(card, 'div') if 'at' in _text(div))
+            )
+            
+            for company_elem in company_elems:
+                company_text = _text(company_elem)
+                if company_text and len(company_text) < 100:
+                    company = company_text
+                    break
             
             # Try to find description
-            description = ""
-            desc_selectors = [
-                '[data-testid="job-description"]',
-                '.css-y4udm8', '.css-1ubo9m8',
-                'p', '.job-description'
-            ]
-            
-            for selector in desc_selectors:
-                try:
-                    desc_elem = card.select_one(selector)
-                    if desc_elem:
-                        description = desc_elem.get_text(strip=True)
-                        if description:
-                            break
-                except:
-                    continue
+            description = next(filter(None, map(_text, _select(card, 'description'))), "")
             
             # Generate unique job_id
             job_id = self._generate_job_id(title, company, job_url or title)
@@ -357,14 +493,48 @@ class JobScraper:
     def _generate_job_id(self, title: str, company: str, unique_str: str) -> str:
         """Generate unique job ID"""
         unique_string = f"{title}_{company}_{unique_str}".lower()
-        return hashlib.md5(unique_string.encode()).hexdigest()[:16]
+        # An 8-byte BLAKE2b digest is the 16 hex characters directly, and unlike
+        # md5 it isn't blocked on FIPS-enabled builds
+        return hashlib.blake2b(unique_string.encode('utf-8', 'replace'), digest_size=8).hexdigest()
     
-    def _process_and_embed_job(self, job: Dict) -> Dict:
-        """Process job data and generate embeddings - FIXED VERSION"""
+    def _process_and_embed_jobs(self, jobs: List[Dict]) -> List[Dict]:
+        """Process job data and generate embeddings for all jobs in one batch"""
+        built_jobs = [built for built in map(self._build_processed_job, jobs) if built is not None]
+        
+        # Jobs too short to embed (e.g. a short title without description) are settled
+        # first, so they aren't looked up in OpenSearch either
+        embeddable_jobs = []
+        for processed_job, embedding_text in built_jobs:
+            # Try to generate embedding only if text is long enough
+            if len(embedding_text) >= MIN_EMBEDDING_TEXT_LENGTH:
+                embeddable_jobs.append((processed_job, embedding_text))
+            else:
+                logger.warning(f"Job text too short for embedding: {processed_job['job_id']} (length: {len(embedding_text)})")
+                processed_job['embedding_status'] = 'skipped_short_text'
+                # DO NOT add job_embedding field to document
+        
+        # Jobs indexed earlier with an embedding of the same text don't need a new one
+        indexed_hashes = self.opensearch.get_embedded_job_hashes([processed_job['job_id'] for processed_job, _ in embeddable_jobs])
+        to_embed = []
+        for processed_job, embedding_text in embeddable_jobs:
+            if indexed_hashes.get(processed_job['job_id']) == processed_job['content_hash']:
+                processed_job['embedding_status'] = 'cached'
+            else:
+                to_embed.append((processed_job, embedding_text))
+        
+        if len(to_embed) < len(embeddable_jobs):
+            logger.info(f"Skipping {len(embeddable_jobs) - len(to_embed)} jobs already indexed with an embedding")
+        
+        self._embed_batch(to_embed)
+        return [processed_job for processed_job, _ in built_jobs]
+    
+    def _build_processed_job(self, job: Dict) -> Optional[Tuple[Dict, str]]:
+        """Build the job document (without embedding) and the text to embed for it"""
         try:
             # Combine title and description for embedding
             embedding_text = f"{job['title']} {job.get('description', '')}"
-            embedding_text = clean_text(embedding_text)
+            embedding_text = _clean_job_text(embedding_text)
+            text_lower = embedding_text.lower()  # Shared by the skill and experience matching
             
             # Prepare base job document WITHOUT embedding field initially
             processed_job = {
@@ -372,99 +542,83 @@ class JobScraper:
                 'title': job['title'],
                 'company': job['company'],
                 'description': job.get('description', ''),
-                'skills_required': self._extract_job_skills(embedding_text),
-                'experience_level': self._extract_experience_level(embedding_text),
+                'skills_required': self._extract_job_skills(text_lower),
+                'experience_level': self._extract_experience_level(text_lower),
                 'location': job.get('location', 'Egypt'),
                 'salary_range': "Not specified",
                 'job_url': job.get('job_url', ''),
                 'scraped_date': job['scraped_timestamp']
             }
-            
-            # Try to generate embedding only if text is long enough
-            if len(embedding_text.strip()) >= 20:  # Minimum viable length
-                try:
-                    # Generate embedding
-                    job_embedding = self.embedding_service.generate_embedding(embedding_text)
-                    
-                    # Thorough validation of embedding
-                    if (job_embedding is not None and 
-                        isinstance(job_embedding, list) and 
-                        len(job_embedding) > 0 and 
-                        all(isinstance(x, (int, float)) and x is not None for x in job_embedding)):
-                        
-                        # Only add embedding field if it's completely valid
-                        processed_job['job_embedding'] = job_embedding
-                        processed_job['embedding_status'] = 'success'
-                        logger.info(f"Successfully generated and validated embedding for job {job['job_id']} (dim: {len(job_embedding)})")
-                    else:
-                        # Log details about the invalid embedding
-                        embedding_info = {
-                            'is_none': job_embedding is None,
-                            'is_list': isinstance(job_embedding, list) if job_embedding is not None else False,
-                            'length': len(job_embedding) if isinstance(job_embedding, list) else 0,
-                            'has_nulls': any(x is None for x in job_embedding) if isinstance(job_embedding, list) else False
-                        }
-                        logger.warning(f"Invalid embedding for job {job['job_id']}: {embedding_info}")
-                        processed_job['embedding_status'] = 'failed_invalid_embedding'
-                        # DO NOT add job_embedding field to document
-                        
-                except Exception as e:
-                    logger.warning(f"Failed to generate embedding for job {job['job_id']}: {str(e)}")
-                    processed_job['embedding_status'] = f'failed_exception: {str(e)[:50]}'
-                    # DO NOT add job_embedding field to document
-            else:
-                logger.warning(f"Job text too short for embedding: {job['job_id']} (length: {len(embedding_text)})")
-                processed_job['embedding_status'] = 'skipped_short_text'
-                # DO NOT add job_embedding field to document
-            
-            # Final validation - ensure no null embedding field exists
-            if 'job_embedding' in processed_job and processed_job['job_embedding'] is None:
-                logger.error(f"Found null job_embedding field in processed job {job['job_id']}, removing it")
-                del processed_job['job_embedding']
-                processed_job['embedding_status'] = 'null_field_removed'
-            
-            return processed_job
+            # Jobs with an unchanged hash are never rewritten, so the hash also covers the
+            # listing's metadata; scraped_date is left out, else no job would ever match
+            hashed = '\x1f'.join([embedding_text, processed_job['company'], processed_job['location'], processed_job['job_url']])
+            # BLAKE2b rather than md5, which is blocked on FIPS-enabled builds
+            processed_job['content_hash'] = hashlib.blake2b(hashed.encode('utf-8', 'replace'), digest_size=16).hexdigest()
+            return processed_job, embedding_text
             
         except Exception as e:
             logger.error(f"Error processing job {job.get('job_id', 'unknown')}: {str(e)}")
             return None
     
-    def _extract_job_skills(self, job_text: str) -> List[str]:
-        """Extract required skills from job description"""
-        skills_patterns = [
-            # Programming languages
-            r'\b(python|java|javascript|typescript|c\+\+|c#|php|ruby|go|kotlin|swift)\b',
-            # Web technologies
-            r'\b(html|css|react|angular|vue|node\.?js|express|django|flask)\b',
-            # Databases
-            r'\b(sql|mysql|postgresql|mongodb|redis|oracle)\b',
-            # Cloud/DevOps
-            r'\b(aws|azure|gcp|docker|kubernetes|jenkins|git)\b',
-            # Data/Analytics
-            r'\b(excel|power\s?bi|tableau|analytics|data)\b'
-        ]
-        
-        found_skills = []
-        text_lower = job_text.lower()
+    def _embed_batch(self, to_embed: List[Tuple[Dict, str]]):
+        """Embed the jobs' texts in one batch, adding the embedding only to jobs where it is valid"""
+        if not to_embed:
+            return
         
-        for pattern in skills_patterns:
-            matches = re.findall(pattern, text_lower, re.IGNORECASE)
-            found_skills.extend(matches)
+        # Bedrock requests for the whole batch run concurrently
+        embeddings = self.embedding_service.generate_embeddings([embedding_text for _, embedding_text in to_embed])
         
-        # Remove duplicates and limit
-        unique_skills = list(set(found_skills))
-        return unique_skills[:10]
+        for (processed_job, _), job_embedding in zip(to_embed, embeddings):
+            job_id = processed_job['job_id']
+            embedding_array = None if job_embedding is None else self._embedding_array(job_embedding)
+            if job_embedding is None:
+                # Details were logged by the embedding service
+                logger.warning(f"Failed to generate embedding for job {job_id}")
+                processed_job['embedding_status'] = 'failed_exception'
+            
+            # Thorough validation of embedding
+            elif embedding_array is not None:
+                # Only add embedding field if it's completely valid. The float32 array is
+                # kept as is, the OpenSearch serializer writes it straight from its buffer.
+                processed_job['job_embedding'] = embedding_array
+                processed_job['embedding_status'] = 'success'
+                logger.info(f"Successfully generated and validated embedding for job {job_id} (dim: {embedding_array.size})")
+            else:
+                # Log details about the invalid embedding
+                embedding_info = {
+                    'is_list': isinstance(job_embedding, list),
+                    'length': len(job_embedding) if isinstance(job_embedding, list) else 0,
+                    'has_nulls': any(x is None for x in job_embedding) if isinstance(job_embedding, list) else False
+                }
+                logger.warning(f"Invalid embedding for job {job_id}: {embedding_info}")
+                processed_job['embedding_status'] = 'failed_invalid_embedding'
+                # DO NOT add job_embedding field to document
     
-    def _extract_experience_level(self, job_text: str) -> str:
-        """Extract experience level from job description"""
-        text_lower = job_text.lower()
+    def _embedding_array(self, job_embedding) -> Optional[np.ndarray]:
+        """Convert an embedding to a float32 array, or None unless it is a non-empty vector of finite numbers"""
+        # A single C-level conversion and scan instead of an isinstance() check per value;
+        # None values become NaN and fail the finiteness check
+        try:
+            embedding_array = np.asarray(job_embedding, dtype=np.float32)
+        except (TypeError, ValueError):
+            return None
         
-        senior_keywords = ['senior', 'lead', 'principal', '5+', '3+', 'experienced', 'expert']
-        junior_keywords = ['junior', 'entry', 'graduate', 'intern', 'fresh', '0-2', 'trainee']
+        if embedding_array.ndim != 1 or embedding_array.size == 0 or not np.isfinite(embedding_array).all():
+            return None
+        return embedding_array
+    
+    def _extract_job_skills(self, text_lower: str) -> List[str]:
+        """Extract required skills from the lowercased job description"""
+        found_skills = [_JOB_SKILL_NAMES[skill] for skill in find_keywords(_JOB_SKILLS_AUTOMATON, text_lower)]
         
-        if any(keyword in text_lower for keyword in senior_keywords):
+        # A skill can be found under two spellings; remove duplicates and limit
+        return list(dict.fromkeys(found_skills))[:10]
+    
+    def _extract_experience_level(self, text_lower: str) -> str:
+        """Extract experience level from the lowercased job description"""
+        if _SENIOR_PATTERN.search(text_lower):
             return 'senior'
-        elif any(keyword in text_lower for keyword in junior_keywords):
+        elif _JUNIOR_PATTERN.search(text_lower):
             return 'junior'
         else:
             return 'mid'
\ No newline at end of file
@@ -0,0 +1,66 @@
+import logging
+import os
+import threading
+from typing import Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_OPENSEARCH_HOST = "search-new-job-recommendationdomain-equlis5ogx733rohqkaxrlabu4.us-east-1.es.amazonaws.com"
+
+# Domain host found through the AWS API, looked up once per container and shared by every
+# client (the handlers' own clients and OpenSearchManager), so they always agree
+_looked_up_host: Optional[str] = None
+_lookup_done = False
+_lookup_lock = threading.Lock()
+
+def host_from_endpoint(endpoint: str) -> str:
+    """Strip scheme, port and path from an endpoint, accepting bare hostnames"""
+    endpoint = endpoint.strip()
+    return urlsplit(endpoint if '://' in endpoint else '//' + endpoint).hostname or endpoint
+
+def get_opensearch_host(region: str) -> str:
+    """Get the OpenSearch domain host, calling the AWS API at most once per container"""
+    # Method 1: Environment variable set by the deployment, no network call
+    endpoint = os.environ.get("OPENSEARCH_ENDPOINT")
+    if endpoint:
+        return host_from_endpoint(endpoint)
+    
+    # Method 2: AWS API, memoized (a failed lookup is only repeated by lookup_opensearch_host)
+    with _lookup_lock:
+        if not _lookup_done:
+            _lookup(region)
+    
+    # Method 3: Hardcoded fallback
+    if _looked_up_host is None:
+        logger.warning(f"Using hardcoded fallback OpenSearch host: {FALLBACK_OPENSEARCH_HOST}")
+    return _looked_up_host or FALLBACK_OPENSEARCH_HOST
+
+def lookup_opensearch_host(region: str) -> Optional[str]:
+    """Look up the domain host through the AWS API again, e.g. after the current host failed.
+
+    Returns None if the lookup fails; otherwise later get_opensearch_host calls return the host found.
+    """
+    with _lookup_lock:
+        return _lookup(region)
+
+def _lookup(region: str) -> Optional[str]:
+    """Query the OpenSearch API, then the legacy ES API, for the domain endpoint (caller holds the lock)"""
+    global _looked_up_host, _lookup_done
+    import boto3  # Not needed when OPENSEARCH_ENDPOINT is set
+    
+    _lookup_done = True
+    domain_name = os.environ.get("OPENSEARCH_DOMAIN_NAME", "new-job-recommendationdomain")
+    try:
+        response = boto3.client('opensearch', region_name=region).describe_domain(DomainName=domain_name)
+    except Exception as e:
+        logger.warning(f"OpenSearch API failed: {str(e)}")
+        try:
+            response = boto3.client('es', region_name=region).describe_elasticsearch_domain(DomainName=domain_name)
+        except Exception as e:
+            logger.warning(f"Could not retrieve OpenSearch endpoint from AWS API: {str(e)}")
+            return None
+    
+    _looked_up_host = host_from_endpoint(response['DomainStatus']['Endpoint'])
+    logger.info(f"Retrieved OpenSearch host from AWS API: {_looked_up_host}")
+    return _looked_up_host
\ No newline at end of file
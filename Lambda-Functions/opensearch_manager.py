@@ -1,112 +1,267 @@
 import json
 import logging
 import os
-from typing import Dict, Any
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import boto3
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
+import certifi
+import numpy as np
+from cachetools import TTLCache
+import orjson
+from opensearchpy import OpenSearch, Urllib3AWSV4SignerAuth, Urllib3HttpConnection, helpers
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
+from opensearch_endpoint import get_opensearch_host
+from semantic_cache import SemanticCache
+from utils import EMBEDDING_DIMENSION, decode_embedding, validate_embedding
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+
+# Index definitions used when the indices are created. Mappings only take
+# effect on index creation, existing indices must be reindexed to pick them up.
+CV_INDEX_BODY = {
+    "settings": {
+        "index": {"knn": True}
+    },
+    "mappings": {
+        "properties": {
+            "user_id": {"type": "keyword"},
+            # Kept in _source: recommendations read it back as the query vector
+            "cv_embedding": {"type": "knn_vector", "dimension": EMBEDDING_DIMENSION}
+        }
+    }
+}
+
+# Needs k-NN 2.19+, the first version where faiss supports cosinesimil (the fp16
+# scalar quantizer needs 2.13). create_indices uses nmslib on older clusters.
+JOB_INDEX_BODY = {
+    "settings": {
+        "index": {"knn": True}
+    },
+    "mappings": {
+        # The vector is only needed for k-NN scoring, so strip it from the stored
+        # _source instead of filtering it out of every search response
+        "_source": {
+            "excludes": ["job_embedding"]
+        },
+        "properties": {
+            "job_id": {"type": "keyword"},
+            # Hash of the embedded text, used to skip re-embedding unchanged listings
+            "content_hash": {"type": "keyword"},
+            "job_embedding": {
+                "type": "knn_vector",
+                "dimension": EMBEDDING_DIMENSION,
+                # Approximate HNSW graph instead of scoring every document. The faiss
+                # scalar quantizer stores the graph vectors as fp16, halving the
+                # memory-resident index without any change on the ingest side.
+                "method": {
+                    "name": "hnsw",
+                    "space_type": "cosinesimil",
+                    "engine": "faiss",
+                    "parameters": {
+                        "ef_construction": 128,
+                        "ef_search": 64,
+                        "m": 16,
+                        "encoder": {"name": "sq", "parameters": {"type": "fp16"}}
+                    }
+                }
+            }
+        }
+    }
+}
+
+FAISS_COSINE_MIN_VERSION = (2, 19)
+
+# Same HNSW graph for clusters older than FAISS_COSINE_MIN_VERSION, with float32 vectors
+_NMSLIB_JOB_EMBEDDING_METHOD = {
+    "name": "hnsw",
+    "space_type": "cosinesimil",
+    "engine": "nmslib",
+    "parameters": {
+        "ef_construction": 128,
+        "m": 16
+    }
+}
+
+# Pooled connections per client: enough for concurrent CV records and batch requests,
+# so none of them has to open (and TLS-handshake) a connection of its own
+DEFAULT_POOL_MAXSIZE = 32
+
+# Bulk requests are sent in chunks of this many documents; loads larger than one chunk
+# are spread over BULK_THREAD_COUNT concurrent requests
+BULK_CHUNK_SIZE = 500
+BULK_THREAD_COUNT = 4
+
+# Query-time ef_search for recommendations (applied on clusters that support it, 2.16+)
+RECOMMENDATION_EF_SEARCH = 64
+
+# TLS context shared by every pooled connection, so the CA bundle is parsed once per
+# container instead of once per new connection. Hostname and certificate checks stay on.
+_SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+class OrjsonSerializer(JSONSerializer):
+    """Client serializer using orjson, which encodes float lists and numpy arrays much faster than json"""
+    
+    def dumps(self, data):
+        # Strings are already serialized
+        if isinstance(data, str):
+            return data
+        try:
+            # The client and the bulk helpers work with str bodies
+            return orjson.dumps(
+                data,
+                default=self.default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            ).decode()
+        except TypeError as e:
+            raise SerializationError(data, e)
+    
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
+
+# Manager shared by every module in a warm container, see get_manager()
+_manager = None
+
 class OpenSearchManager:
-    def __init__(self):
+    def __init__(self, pool_maxsize: int = DEFAULT_POOL_MAXSIZE):
         self.region = os.environ.get("AWS_REGION", "us-east-1")
-        self.host = self._get_domain_host()
+        # Resolved like the handlers' own clients, see opensearch_endpoint
+        self.host = get_opensearch_host(self.region)
+        self._pool_maxsize = pool_maxsize
         self.cv_index = 'cv-index'
         self.job_index = 'job-index'
+        self._cluster_version: Optional[str] = None  # Looked up on first search
+        
+        # CVs recently read by get_cv_by_user_id and get_cv_with_job_count, so repeated
+        # recommendation requests in a warm container skip the search; entries are
+        # dropped when the CV is re-indexed. The job count is only display metadata.
+        self._cv_cache = TTLCache(maxsize=1024, ttl=60)
+        self._job_count_cache = TTLCache(maxsize=1, ttl=60)
+        self._cv_cache_lock = threading.Lock()  # CVs are indexed from several threads
         
-        # Set up AWS authentication for OpenSearch
+        # Unfiltered similar-jobs responses, reused for near-identical CV embeddings
+        self._recommendation_cache = SemanticCache(threshold=0.95, maxsize=1024, ttl=300)
+        self._recommendation_cache_lock = threading.Lock()
+        
+        # Set up AWS authentication for OpenSearch. The signer uses botocore's SigV4
+        # implementation and reads the (refreshable) credentials on every request.
         session = boto3.Session()
         credentials = session.get_credentials()
-        self.awsauth = AWS4Auth(
-            credentials.access_key,
-            credentials.secret_key, 
-            self.region,
-            'es',
-            session_token=credentials.token
-        )
+        self.awsauth = Urllib3AWSV4SignerAuth(credentials, self.region, 'es')
         
-        # Initialize OpenSearch client with proper authentication
-        self.client = OpenSearch(
+        self.client = self._create_client()
+        
+        logger.info(f"Initialized OpenSearchManager with host: {self.host}")
+    
+    def _create_client(self) -> OpenSearch:
+        """Create the OpenSearch client for the current host"""
+        return OpenSearch(
             hosts=[{'host': self.host, 'port': 443}],
             http_auth=self.awsauth,
             use_ssl=True,
-            verify_certs=True,
-            connection_class=RequestsHttpConnection,
+            ssl_context=_SSL_CONTEXT,  # Verifies certificates, see _SSL_CONTEXT
+            # urllib3 directly, without the requests layer on top of it
+            connection_class=Urllib3HttpConnection,
+            maxsize=self._pool_maxsize,  # Reused across warm invocations and concurrent requests
+            http_compress=True,  # Embedding JSON compresses roughly 2x
+            serializer=OrjsonSerializer(),
             timeout=60,
             max_retries=3,
             retry_on_timeout=True
         )
-        
-        logger.info(f"Initialized OpenSearchManager with host: {self.host}")
     
-    def _get_domain_host(self) -> str:
-        """Get OpenSearch domain host (without https://) with robust error handling"""
-        try:
-            # Method 1: Environment variable
-            endpoint = os.environ.get('OPENSEARCH_ENDPOINT')
-            if endpoint and len(endpoint) < 200:  # Sanity check for clean endpoint
-                host = endpoint.strip().replace('https://', '').replace('http://', '')
-                if '.' in host and 'amazonaws.com' in host:  # Basic validation
-                    logger.info(f"Using OpenSearch host from env var: {host}")
-                    return host
-            
-            # Method 2: AWS OpenSearch API
-            domain_name = os.environ.get('OPENSEARCH_DOMAIN_NAME', 'new-job-recommendationdomain')
-            
-            try:
-                client = boto3.client('opensearch', region_name=self.region)
-                response = client.describe_domain(DomainName=domain_name)
-                endpoint = response['DomainStatus']['Endpoint']
-                host = endpoint.strip().replace('https://', '').replace('http://', '')
-                logger.info(f"Retrieved OpenSearch host from AWS OpenSearch API: {host}")
-                return host
-            except Exception as e:
-                logger.warning(f"OpenSearch API failed: {str(e)}")
-            
-            # Method 3: AWS ES API (legacy fallback)
+    def set_host(self, host: str):
+        """Switch to a re-resolved domain host, replacing the client connected to the old one"""
+        if host == self.host:
+            return
+        logger.info(f"Switching OpenSearchManager from host {self.host} to {host}")
+        self.host = host
+        self.client = self._create_client()
+        self._cluster_version = None
+    
+    def create_indices(self) -> Dict:
+        """Create the CV and job indices with their mappings if they don't exist"""
+        results = {}
+        for index_name in (self.cv_index, self.job_index):
             try:
-                client = boto3.client('es', region_name=self.region)
-                response = client.describe_elasticsearch_domain(DomainName=domain_name)
-                endpoint = response['DomainStatus']['Endpoint']
-                host = endpoint.strip().replace('https://', '').replace('http://', '')
-                logger.info(f"Retrieved OpenSearch host from AWS ES API: {host}")
-                return host
+                if self.client.indices.exists(index=index_name):
+                    results[index_name] = 'exists'
+                    continue
+                
+                index_body = CV_INDEX_BODY if index_name == self.cv_index else self._job_index_body()
+                self.client.indices.create(index=index_name, body=index_body)
+                logger.info(f"Created index {index_name}")
+                results[index_name] = 'created'
+                
             except Exception as e:
-                logger.warning(f"ES API failed: {str(e)}")
-            
-            # Method 4: Hardcoded fallback
-            fallback_host = "search-new-job-recommendationdomain-equlis5ogx733rohqkaxrlabu4.us-east-1.es.amazonaws.com"
-            logger.warning(f"Using hardcoded fallback host: {fallback_host}")
-            return fallback_host
-            
-        except Exception as e:
-            logger.error(f"Error getting OpenSearch host: {str(e)}")
-            # Final emergency fallback
-            return "search-new-job-recommendationdomain-equlis5ogx733rohqkaxrlabu4.us-east-1.es.amazonaws.com"
+                logger.error(f"Error creating index {index_name}: {str(e)}")
+                results[index_name] = f'error: {str(e)}'
+        
+        return results
+    
+    def _job_index_body(self) -> Dict:
+        """Job index body for this cluster: faiss with fp16 vectors, or nmslib on older versions"""
+        if self._version_tuple(self._get_cluster_version()) >= FAISS_COSINE_MIN_VERSION:
+            return JOB_INDEX_BODY
+        
+        mappings = JOB_INDEX_BODY["mappings"]
+        return {
+            # nmslib takes ef_search from the index settings rather than the method parameters
+            "settings": {
+                "index": {"knn": True, "knn.algo_param.ef_search": 64}
+            },
+            "mappings": {
+                **mappings,
+                "properties": {
+                    **mappings["properties"],
+                    "job_embedding": {
+                        "type": "knn_vector",
+                        "dimension": EMBEDDING_DIMENSION,
+                        "method": _NMSLIB_JOB_EMBEDDING_METHOD
+                    }
+                }
+            }
+        }
+    
+    def _prepare_cv_document(self, user_id: str, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate a CV document for indexing, dropping an empty cv_embedding field"""
+        # Validate document has required fields
+        required_fields = ['user_id', 'cv_text']
+        for field in required_fields:
+            if field not in document:
+                raise ValueError(f"Missing required field: {field}")
+        
+        # Handle cv_embedding - only include if valid
+        if 'cv_embedding' in document:
+            embedding = decode_embedding(document.get('cv_embedding'))
+            if embedding is not document['cv_embedding']:
+                document = {**document, 'cv_embedding': embedding}
+            if embedding is None or len(embedding) == 0:
+                logger.warning(f"CV embedding is empty for user {user_id}, removing from document")
+                document = {k: v for k, v in document.items() if k != 'cv_embedding'}
+        
+        return document
     
-    def index_cv_document(self, user_id: str, document: Dict[str, Any]) -> Dict:
-        """Index a CV document in OpenSearch"""
+    def index_cv_document(self, user_id: str, document: Dict[str, Any], refresh: bool = False) -> Dict:
+        """Index a CV document in OpenSearch (searchable immediately only with refresh, see flush_refresh)"""
         try:
-            # Validate document has required fields
-            required_fields = ['user_id', 'cv_text']
-            for field in required_fields:
-                if field not in document:
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # Handle cv_embedding - only include if valid
-            if 'cv_embedding' in document:
-                embedding = document.get('cv_embedding')
-                if not embedding or len(embedding) == 0:
-                    logger.warning(f"CV embedding is empty for user {user_id}, removing from document")
-                    document = {k: v for k, v in document.items() if k != 'cv_embedding'}
+            document = self._prepare_cv_document(user_id, document)
+            
+            with self._cv_cache_lock:
+                self._cv_cache.pop(user_id, None)
             
             response = self.client.index(
                 index=self.cv_index, 
                 id=user_id, 
                 body=document, 
-                refresh=True
+                refresh=refresh
             )
             
             logger.info(f"Successfully indexed CV document for user {user_id}")
@@ -116,27 +271,96 @@ class OpenSearchManager:
             logger.error(f"Error indexing CV document for user {user_id}: {str(e)}")
             raise e
     
+    def bulk_index_cv_documents(self, documents: List[Dict[str, Any]]) -> Dict:
+        """Index many CV documents with the bulk API, returning counts and per-document errors"""
+        actions = []
+        errors = []
+        for document in documents:
+            user_id = document.get('user_id')
+            try:
+                actions.append({
+                    "_op_type": "index",
+                    "_index": self.cv_index,
+                    "_id": user_id,
+                    "_source": self._prepare_cv_document(user_id, document)
+                })
+            except ValueError as e:
+                logger.error(f"Skipping CV document for user {user_id}: {str(e)}")
+                errors.append({'index': {'_id': user_id, 'error': str(e)}})
+        
+        with self._cv_cache_lock:
+            for action in actions:
+                self._cv_cache.pop(action["_id"], None)
+        
+        indexed, bulk_errors = self._bulk_index(actions)
+        errors += bulk_errors
+        if indexed:
+            self._refresh_index(self.cv_index)
+        
+        logger.info(f"Bulk indexed {indexed} of {len(documents)} CV documents ({len(errors)} errors)")
+        return {'indexed': indexed, 'errors': errors}
+    
+    def _bulk_index(self, actions: List[Dict[str, Any]]) -> Tuple[int, List[Dict]]:
+        """Send index actions with the bulk API, without refreshing the index"""
+        if not actions:
+            return 0, []
+        
+        chunks = [actions[i:i + BULK_CHUNK_SIZE] for i in range(0, len(actions), BULK_CHUNK_SIZE)]
+        if len(chunks) == 1:
+            return self._bulk_index_chunk(actions)
+        
+        # Backfills send their chunks concurrently, keeping the cluster's indexing
+        # threads busy (the connection pool is larger than BULK_THREAD_COUNT). Each
+        # chunk keeps the 429 retry with backoff that parallel_bulk doesn't have.
+        indexed = 0
+        errors = []
+        with ThreadPoolExecutor(max_workers=BULK_THREAD_COUNT) as executor:
+            for chunk_indexed, chunk_errors in executor.map(self._bulk_index_chunk, chunks):
+                indexed += chunk_indexed
+                errors.extend(chunk_errors)
+        return indexed, errors
+    
+    def _bulk_index_chunk(self, actions: List[Dict[str, Any]]) -> Tuple[int, List[Dict]]:
+        """Send up to BULK_CHUNK_SIZE index actions in one bulk request"""
+        # A request rejected with 429 is retried with exponential backoff
+        return helpers.bulk(
+            self.client,
+            actions,
+            chunk_size=BULK_CHUNK_SIZE,
+            max_chunk_bytes=100 * 1024 * 1024,
+            max_retries=3,
+            initial_backoff=2,
+            raise_on_error=False,
+            request_timeout=60
+        )
+    
+    def flush_refresh(self):
+        """Refresh both indices once, making every document indexed since the last refresh searchable"""
+        # Called once per batch (e.g. per invocation) instead of refreshing per document
+        self._refresh_index(f"{self.cv_index},{self.job_index}")
+    
+    def _refresh_index(self, index: str):
+        """Refresh an index once after a bulk load, instead of once per chunk"""
+        try:
+            self.client.indices.refresh(index=index)
+        except Exception as e:
+            logger.warning(f"Error refreshing index {index}: {str(e)}")
+    
     def get_cv_by_user_id(self, user_id: str) -> Dict:
         """Get CV document by user_id"""
+        with self._cv_cache_lock:
+            cached = self._cv_cache.get(user_id)
+        if cached is not None:
+            logger.info(f"Using cached CV for user {user_id}")
+            return cached
+        
         try:
             if not self.client.indices.exists(index=self.cv_index):
                 logger.warning(f"CV index {self.cv_index} does not exist")
                 return None
             
             # Search for CV document by user_id
-            search_body = {
-                "query": {
-                    "term": {
-                        "user_id": user_id
-                    }
-                },
-                "size": 1,
-                "_source": {
-                    "exclude": ["cv_text"]  # Exclude large text field, keep embedding and metadata
-                }
-            }
-            
-            result = self.client.search(index=self.cv_index, body=search_body)
+            result = self.client.search(index=self.cv_index, body=self._cv_search_body(user_id))
             
             hits = result.get('hits', {}).get('hits', [])
             if not hits:
@@ -146,67 +370,157 @@ class OpenSearchManager:
             cv_document = hits[0]['_source']
             logger.info(f"Retrieved CV for user {user_id} with {len(cv_document.get('cv_embedding', []))} embedding dimensions")
             
+            with self._cv_cache_lock:
+                self._cv_cache[user_id] = cv_document
             return cv_document
             
         except Exception as e:
             logger.error(f"Error retrieving CV for user {user_id}: {str(e)}")
             return None
     
-    def index_job_document(self, job_id: str, document: Dict[str, Any]) -> Dict:
-        """Index a job document in OpenSearch - FIXED VERSION"""
+    @staticmethod
+    def _cv_search_body(user_id: str) -> Dict:
+        """Search body for a user's CV; cached documents then have the same fields whoever fetched them"""
+        return {
+            "query": {
+                "term": {
+                    "user_id": user_id
+                }
+            },
+            "size": 1,
+            "_source": {
+                "exclude": ["cv_text"]  # Exclude large text field, keep embedding and metadata
+            }
+        }
+    
+    def get_cv_with_job_count(self, user_id: str) -> Tuple[Optional[Dict], int]:
+        """Get the CV and the job count, from the cache or in one msearch round trip"""
+        with self._cv_cache_lock:
+            cv_document = self._cv_cache.get(user_id)
+            job_count = self._job_count_cache.get(self.job_index)
+        if cv_document is not None and job_count is not None:
+            logger.info(f"Using cached CV and job count for user {user_id}")
+            return cv_document, job_count
+        
         try:
-            # Create a deep copy of the document to avoid modifying the original
-            import copy
-            doc_to_index = copy.deepcopy(document)
-            
-            # Debug logging
-            logger.info(f"Attempting to index job {job_id}")
-            logger.info(f"Document keys: {list(doc_to_index.keys())}")
-            
-            # Handle job_embedding field very carefully
-            if 'job_embedding' in doc_to_index:
-                embedding = doc_to_index.get('job_embedding')
-                logger.info(f"Job {job_id} embedding info: type={type(embedding)}, is_none={embedding is None}")
+            # Only what isn't cached is searched for
+            searches = []
+            if cv_document is None:
+                searches.append(('cv', self.cv_index, self._cv_search_body(user_id)))
+            if job_count is None:
+                searches.append(('jobs', self.job_index, {"query": {"match_all": {}}, "size": 0, "track_total_hits": True}))
+            
+            search_body = []
+            for _, index, body in searches:
+                search_body.append({"index": index})
+                search_body.append(body)
+            
+            responses = self.client.msearch(body=search_body)['responses']
+            
+            for (name, _, _), response in zip(searches, responses):
+                if 'error' in response:
+                    logger.warning(f"{'CV lookup' if name == 'cv' else 'Job count'} failed for user {user_id}: {response['error']}")
+                    continue
                 
-                if embedding is not None:
-                    logger.info(f"Job {job_id} embedding length: {len(embedding) if hasattr(embedding, '__len__') else 'no length'}")
+                if name == 'jobs':
+                    job_count = response.get('hits', {}).get('total', {}).get('value', 0)
+                    with self._cv_cache_lock:
+                        self._job_count_cache[self.job_index] = job_count
+                    continue
                 
-                # Comprehensive validation
-                embedding_is_valid = (
-                    embedding is not None and 
-                    isinstance(embedding, list) and 
-                    len(embedding) > 0 and 
-                    all(isinstance(x, (int, float)) and x is not None for x in embedding)
-                )
-                
-                if not embedding_is_valid:
-                    logger.warning(f"Job {job_id} has invalid embedding, removing field. Details:")
-                    logger.warning(f"  - embedding is None: {embedding is None}")
-                    logger.warning(f"  - is list: {isinstance(embedding, list) if embedding is not None else False}")
-                    logger.warning(f"  - length > 0: {len(embedding) > 0 if hasattr(embedding, '__len__') else False}")
-                    
-                    if isinstance(embedding, list) and len(embedding) > 0:
-                        none_count = sum(1 for x in embedding if x is None)
-                        non_numeric_count = sum(1 for x in embedding if not isinstance(x, (int, float)))
-                        logger.warning(f"  - null values in embedding: {none_count}")
-                        logger.warning(f"  - non-numeric values: {non_numeric_count}")
-                    
-                    # Remove the embedding field entirely
-                    del doc_to_index['job_embedding']
-                    
-                    # Update status
-                    doc_to_index['embedding_status'] = 'invalid_embedding_removed'
+                hits = response.get('hits', {}).get('hits', [])
+                if hits:
+                    cv_document = hits[0]['_source']
+                    logger.info(f"Retrieved CV for user {user_id} with {len(cv_document.get('cv_embedding', []))} embedding dimensions")
+                    with self._cv_cache_lock:
+                        self._cv_cache[user_id] = cv_document
                 else:
-                    logger.info(f"Job {job_id} has valid embedding with {len(embedding)} dimensions")
+                    logger.info(f"No CV found for user_id: {user_id}")
+            
+            return cv_document, job_count or 0
             
-            logger.info(f"Final document keys for job {job_id}: {list(doc_to_index.keys())}")
+        except Exception as e:
+            logger.error(f"Error retrieving CV and job count for user {user_id}: {str(e)}")
+            return cv_document, job_count or 0
+    
+    def _prepare_job_document(self, job_id: str, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a job document for indexing, dropping an invalid job_embedding field"""
+        # A shallow copy is enough to leave the original untouched: fields are only
+        # replaced or removed below, never mutated in place
+        doc_to_index = dict(document)
+        
+        # Debug logging
+        logger.info(f"Attempting to index job {job_id}")
+        logger.info(f"Document keys: {list(doc_to_index.keys())}")
+        
+        # Handle job_embedding field very carefully
+        if 'job_embedding' in doc_to_index:
+            # Producers may send the vector as a base64 float32 buffer; orjson serializes the
+            # decoded array directly, so it is never turned into a list of floats
+            embedding = decode_embedding(doc_to_index.get('job_embedding'))
+            doc_to_index['job_embedding'] = embedding
+            logger.info(f"Job {job_id} embedding info: type={type(embedding)}, is_none={embedding is None}")
+            
+            if embedding is not None:
+                logger.info(f"Job {job_id} embedding length: {len(embedding) if hasattr(embedding, '__len__') else 'no length'}")
+            
+            # Comprehensive validation, vectorized for lists and numpy arrays alike
+            embedding_is_valid = validate_embedding(embedding)
+            
+            if not embedding_is_valid:
+                logger.warning(f"Job {job_id} has invalid embedding, removing field. Details:")
+                logger.warning(f"  - embedding is None: {embedding is None}")
+                logger.warning(f"  - is list or array: {isinstance(embedding, (list, np.ndarray))}")
+                logger.warning(f"  - length > 0: {len(embedding) > 0 if hasattr(embedding, '__len__') else False}")
+                
+                if isinstance(embedding, list) and len(embedding) > 0:
+                    none_count = sum(1 for x in embedding if x is None)
+                    non_numeric_count = sum(1 for x in embedding if not isinstance(x, (int, float)))
+                    logger.warning(f"  - null values in embedding: {none_count}")
+                    logger.warning(f"  - non-numeric values: {non_numeric_count}")
+                
+                # Remove the embedding field entirely
+                del doc_to_index['job_embedding']
+                
+                # Update status
+                doc_to_index['embedding_status'] = 'invalid_embedding_removed'
+            else:
+                logger.info(f"Job {job_id} has valid embedding with {len(embedding)} dimensions")
+        
+        logger.info(f"Final document keys for job {job_id}: {list(doc_to_index.keys())}")
+        return doc_to_index
+    
+    def get_embedded_job_hashes(self, job_ids: List[str]) -> Dict[str, str]:
+        """Get the content_hash of those jobs that are already indexed with an embedding, in one mget"""
+        if not job_ids:
+            return {}
+        try:
+            response = self.client.mget(
+                index=self.job_index,
+                body={"ids": job_ids},
+                _source_includes=["content_hash", "embedding_status"]
+            )
+            return {
+                doc['_id']: doc['_source']['content_hash']
+                for doc in response.get('docs', [])
+                if doc.get('found') and doc['_source'].get('embedding_status') == 'success'
+                and doc['_source'].get('content_hash')
+            }
+        except Exception as e:
+            logger.warning(f"Error looking up indexed jobs: {str(e)}")
+            return {}
+    
+    def index_job_document(self, job_id: str, document: Dict[str, Any], refresh: bool = False) -> Dict:
+        """Index a job document in OpenSearch (searchable immediately only with refresh, see flush_refresh)"""
+        try:
+            doc_to_index = self._prepare_job_document(job_id, document)
             
             # Index the document
             response = self.client.index(
                 index=self.job_index, 
                 id=job_id, 
                 body=doc_to_index, 
-                refresh=True
+                refresh=refresh
             )
             
             embedding_info = "with embedding" if 'job_embedding' in doc_to_index else "without embedding"
@@ -227,7 +541,7 @@ class OpenSearchManager:
                         index=self.job_index, 
                         id=job_id, 
                         body=doc_retry, 
-                        refresh=True
+                        refresh=refresh
                     )
                     
                     logger.info(f"Successfully indexed job document {job_id} on retry (without embedding)")
@@ -238,58 +552,61 @@ class OpenSearchManager:
             else:
                 raise e
     
-    def search_similar_jobs(self, cv_embedding: list, size: int = 10) -> Dict:
-        """Search for similar jobs using CV embedding"""
+    def bulk_index_job_documents(self, documents: List[Dict[str, Any]]) -> Dict:
+        """Index many job documents with the bulk API, returning counts and per-document errors"""
+        actions = [
+            {
+                "_op_type": "index",
+                "_index": self.job_index,
+                "_id": document['job_id'],
+                "_source": self._prepare_job_document(document['job_id'], document)
+            }
+            for document in documents
+        ]
+        indexed, errors = self._bulk_index(actions)
+        
+        # Same fallback as index_job_document: retry embedding-related failures without the vector
+        retry_ids = set()
+        for error in errors:
+            item = error.get('index', {})
+            reason = str(item.get('error', ''))
+            if "job_embedding" in reason or "knn_vector" in reason or "null" in reason:
+                retry_ids.add(item.get('_id'))
+        
+        if retry_ids:
+            logger.warning(f"Retrying {len(retry_ids)} jobs without embedding field due to embedding-related errors")
+            retry_actions = [
+                {**action, "_source": {
+                    **{k: v for k, v in action["_source"].items() if k != 'job_embedding'},
+                    'embedding_status': 'removed_due_to_indexing_error'
+                }}
+                for action in actions if action["_id"] in retry_ids
+            ]
+            retried, retry_errors = self._bulk_index(retry_actions)
+            indexed += retried
+            errors = [error for error in errors if error.get('index', {}).get('_id') not in retry_ids] + retry_errors
+        
+        if indexed:
+            self._refresh_index(self.job_index)
+        
+        logger.info(f"Bulk indexed {indexed} of {len(actions)} job documents ({len(errors)} errors)")
+        return {'indexed': indexed, 'errors': errors}
+    
+    def search_similar_jobs(self, cv_embedding: list, size: int = 10, ef_search: int = None,
+                            track_total_hits: bool = False) -> Dict:
+        """Search for similar jobs using CV embedding (hits.total is only counted if track_total_hits is set).
+
+        The response's 'knn_search' key is True only if the hits were ranked by k-NN similarity.
+        """
         try:
             if not cv_embedding or len(cv_embedding) == 0:
                 raise ValueError("CV embedding is empty")
             
-            # Check OpenSearch version to determine search method
-            cluster_info = self.client.info()
-            version = cluster_info.get('version', {}).get('number', '1.0.0')
+            search_body = self._similar_jobs_body(cv_embedding, size, ef_search, track_total_hits)
             
-            if version.startswith('2.') or version.startswith('3.'):
-                # Use KNN search for OpenSearch 2.x+
-                search_body = {
-                    "size": size,
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {
-                                    "knn": {
-                                        "job_embedding": {
-                                            "vector": cv_embedding,
-                                            "k": size
-                                        }
-                                    }
-                                }
-                            ],
-                            "filter": [
-                                {"exists": {"field": "job_embedding"}}  # Only return jobs with embeddings
-                            ]
-                        }
-                    },
-                    "_source": {
-                        "exclude": ["job_embedding"]
-                    }
-                }
-            else:
-                # Fallback to basic search for older versions
-                search_body = {
-                    "size": size,
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {"exists": {"field": "job_embedding"}}
-                            ]
-                        }
-                    },
-                    "_source": {
-                        "exclude": ["job_embedding"]
-                    }
-                }
-            
-            return self.client.search(index=self.job_index, body=search_body)
+            response = self.client.search(index=self.job_index, body=search_body)
+            response['knn_search'] = self._supports_knn_query()
+            return response
             
         except Exception as e:
             logger.error(f"Error searching similar jobs: {str(e)}")
@@ -297,15 +614,139 @@ class OpenSearchManager:
             try:
                 basic_search = {
                     "size": size,
+                    "track_total_hits": track_total_hits,
                     "query": {"match_all": {}},
                     "_source": {"exclude": ["job_embedding"]}
                 }
                 logger.info("Falling back to basic job search without embedding similarity")
-                return self.client.search(index=self.job_index, body=basic_search)
+                response = self.client.search(index=self.job_index, body=basic_search)
+                response['knn_search'] = False
+                return response
             except Exception as fallback_error:
                 logger.error(f"Fallback search also failed: {str(fallback_error)}")
                 raise e
     
+    def _similar_jobs_body(self, cv_embedding, size: int, ef_search: int = None,
+                           track_total_hits: bool = False, filter_clause: Dict = None) -> Dict:
+        """Build the similar-jobs search body, optionally restricted by a filter clause"""
+        # Check OpenSearch version to determine search method
+        version = self._get_cluster_version()
+        
+        if self._supports_knn_query():
+            # Use approximate KNN search against the HNSW index for OpenSearch 2.x+
+            knn_query = {
+                "vector": cv_embedding,
+                "k": size
+            }
+            # Query-time ef_search is supported from 2.16, older clusters use the index setting
+            if ef_search and self._version_tuple(version) >= (2, 16):
+                knn_query["method_parameters"] = {"ef_search": ef_search}
+            
+            query = {"knn": {"job_embedding": knn_query}}
+            if filter_clause:
+                if self._version_tuple(version) >= (2, 9):
+                    # Filtered during the graph search, so k matching jobs are still returned
+                    knn_query["filter"] = filter_clause
+                else:
+                    query = {"bool": {"must": [query], "filter": [filter_clause]}}
+        else:
+            # Fallback to basic search for older versions
+            # Without a total to count, the constant-score query stops after size hits
+            query = {
+                "bool": {
+                    "must": [
+                        {"exists": {"field": "job_embedding"}}
+                    ]
+                }
+            }
+            if filter_clause:
+                query["bool"]["filter"] = [filter_clause]
+        
+        return {
+            "size": size,
+            "track_total_hits": track_total_hits,
+            "query": query,
+            "_source": {
+                "exclude": ["job_embedding"]
+            }
+        }
+    
+    def recommend_for_user(self, user_id: str, size: int = 10, filters: Optional[Dict[str, Dict]] = None,
+                           ef_search: int = RECOMMENDATION_EF_SEARCH) -> Tuple[Optional[Dict], int, Dict[str, Dict]]:
+        """Get a user's CV, the job count and the CV's similar jobs, unfiltered ('all') and per named filter.
+
+        Returns the CV (None if not found), the job count and the search response for each query;
+        there are no responses if the CV has no embedding.
+        """
+        # Both usually come from the TTL caches, otherwise from one msearch
+        cv_document, job_count = self.get_cv_with_job_count(user_id)
+        if not cv_document or not cv_document.get('cv_embedding'):
+            return cv_document, job_count, {}
+        cv_embedding = cv_document['cv_embedding']
+        
+        results = {}
+        with self._recommendation_cache_lock:
+            cached = self._recommendation_cache.get(cv_embedding)
+        if cached is not None and cached[0] == size:
+            logger.info(f"Serving similar jobs for user {user_id} from semantic cache")
+            results['all'] = cached[1]
+        
+        queries = dict(filters or {})
+        if 'all' not in results:
+            queries['all'] = None
+        
+        if queries and queries.keys() != {'all'}:
+            # The filtered queries (and the unfiltered one, if not cached) share one round trip
+            try:
+                search_body = []
+                for filter_clause in queries.values():
+                    search_body.append({"index": self.job_index})
+                    search_body.append(self._similar_jobs_body(cv_embedding, size, ef_search, False, filter_clause))
+                
+                responses = self.client.msearch(body=search_body)['responses']
+            except Exception as e:
+                logger.error(f"Error running recommendation searches for user {user_id}: {str(e)}")
+                responses = [{'error': str(e)}] * len(queries)
+            
+            for name, response in zip(queries, responses):
+                if 'error' in response:
+                    logger.warning(f"Recommendation search '{name}' failed for user {user_id}: {response['error']}")
+                else:
+                    response['knn_search'] = self._supports_knn_query()
+                    results[name] = response
+        
+        if 'all' not in results:
+            # search_similar_jobs falls back to a basic search if the k-NN query keeps failing
+            results['all'] = self.search_similar_jobs(cv_embedding, size=size, ef_search=ef_search)
+        
+        # Unranked fallback results would otherwise be served to every nearby CV for the full TTL
+        if cached is None and results['all'].get('knn_search'):
+            with self._recommendation_cache_lock:
+                self._recommendation_cache.set(cv_embedding, (size, results['all']))
+        
+        return cv_document, job_count, results
+    
+    def _supports_knn_query(self) -> bool:
+        """Check whether the cluster runs the k-NN query (OpenSearch 2.x+) rather than the exists fallback"""
+        return self._get_cluster_version().startswith(('2.', '3.'))
+    
+    def _get_cluster_version(self) -> str:
+        """Get the cluster's version number, requesting it only once per manager"""
+        if self._cluster_version is None:
+            self._cluster_version = self.client.info().get('version', {}).get('number', '1.0.0')
+        return self._cluster_version
+    
+    @staticmethod
+    def _version_tuple(version: str) -> tuple:
+        """Convert a version string like '2.11.0' into a comparable tuple"""
+        parts = []
+        for part in version.split('.')[:2]:
+            try:
+                parts.append(int(part))
+            except ValueError:
+                parts.append(0)
+        return tuple(parts)
+    
     def get_jobs_without_embeddings(self, size: int = 10) -> Dict:
         """Get jobs that don't have embeddings for debugging purposes"""
         try:
@@ -329,15 +770,43 @@ class OpenSearchManager:
             logger.error(f"Error getting jobs without embeddings: {str(e)}")
             return {"hits": {"hits": []}}
     
+    def _call_concurrently(self, calls: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """Run independent client calls in parallel, returning each one's result or the exception it raised"""
+        def call(func):
+            try:
+                return func()
+            except Exception as e:
+                return e
+        
+        # The client's connection pool is shared by the threads, so the total time is
+        # that of the slowest call rather than the sum of all of them
+        with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+            return dict(zip(calls, executor.map(call, calls.values())))
+    
     def test_connection(self) -> Dict:
         """Test OpenSearch connection and return status"""
         try:
-            # Test cluster health
-            health = self.client.cluster.health()
+            # Cluster health, index existence and document counts are requested together;
+            # counts of an index that doesn't exist fail and are ignored below
+            results = self._call_concurrently({
+                'health': self.client.cluster.health,
+                'cv_exists': lambda: self.client.indices.exists(index=self.cv_index),
+                'job_exists': lambda: self.client.indices.exists(index=self.job_index),
+                'cv_count': lambda: self.client.count(index=self.cv_index),
+                'job_count': lambda: self.client.count(index=self.job_index),
+                # Count jobs with embeddings
+                'with_embeddings': lambda: self.client.count(
+                    index=self.job_index,
+                    body={"query": {"exists": {"field": "job_embedding"}}}
+                )
+            })
             
-            # Test index existence
-            cv_exists = self.client.indices.exists(index=self.cv_index)
-            job_exists = self.client.indices.exists(index=self.job_index)
+            for key in ('health', 'cv_exists', 'job_exists'):
+                if isinstance(results[key], Exception):
+                    raise results[key]
+            health = results['health']
+            cv_exists = results['cv_exists']
+            job_exists = results['job_exists']
             
             # Get document counts
             cv_count = 0
@@ -346,27 +815,19 @@ class OpenSearchManager:
             jobs_without_embeddings = 0
             
             if cv_exists:
-                try:
-                    cv_stats = self.client.count(index=self.cv_index)
-                    cv_count = cv_stats.get('count', 0)
-                except Exception as e:
-                    logger.warning(f"Could not get CV count: {str(e)}")
+                if isinstance(results['cv_count'], Exception):
+                    logger.warning(f"Could not get CV count: {str(results['cv_count'])}")
+                else:
+                    cv_count = results['cv_count'].get('count', 0)
             
             if job_exists:
-                try:
-                    job_stats = self.client.count(index=self.job_index)
-                    job_count = job_stats.get('count', 0)
-                    
-                    # Count jobs with embeddings
-                    with_embeddings = self.client.count(
-                        index=self.job_index,
-                        body={"query": {"exists": {"field": "job_embedding"}}}
-                    )
-                    jobs_with_embeddings = with_embeddings.get('count', 0)
+                error = next((results[key] for key in ('job_count', 'with_embeddings') if isinstance(results[key], Exception)), None)
+                if error is not None:
+                    logger.warning(f"Could not get job counts: {str(error)}")
+                else:
+                    job_count = results['job_count'].get('count', 0)
+                    jobs_with_embeddings = results['with_embeddings'].get('count', 0)
                     jobs_without_embeddings = job_count - jobs_with_embeddings
-                    
-                except Exception as e:
-                    logger.warning(f"Could not get job counts: {str(e)}")
             
             logger.info(f"OpenSearch connection successful - Cluster: {health.get('status', 'unknown')}")
             
@@ -398,45 +859,52 @@ class OpenSearchManager:
         try:
             stats = {}
             
+            # Document counts of both indices come from one stats request, sent together with
+            # the embedding count; a missing index is simply absent from the stats response
+            results = self._call_concurrently({
+                'index_stats': lambda: self.client.indices.stats(
+                    index=f"{self.cv_index},{self.job_index}",
+                    metric="docs",
+                    ignore_unavailable=True
+                ),
+                'with_embeddings': lambda: self.client.count(
+                    index=self.job_index,
+                    body={"query": {"exists": {"field": "job_embedding"}}}
+                )
+            })
+            
+            if isinstance(results['index_stats'], Exception):
+                raise results['index_stats']
+            indices = results['index_stats'].get('indices', {})
+            
+            def doc_count(index):
+                # Primary shards only, replicas hold copies of the same documents
+                return indices[index]['primaries']['docs']['count']
+            
             # CV Index stats
-            if self.client.indices.exists(index=self.cv_index):
-                cv_stats = self.client.count(index=self.cv_index)
-                stats['cv_documents'] = cv_stats.get('count', 0)
-                
-                # Get sample document
-                try:
-                    sample = self.client.search(index=self.cv_index, body={"size": 1})
-                    stats['cv_sample_available'] = len(sample['hits']['hits']) > 0
-                except:
-                    stats['cv_sample_available'] = False
+            if self.cv_index in indices:
+                stats['cv_documents'] = doc_count(self.cv_index)
+                stats['cv_sample_available'] = stats['cv_documents'] > 0
             else:
                 stats['cv_documents'] = 0
                 stats['cv_sample_available'] = False
             
             # Job Index stats
-            if self.client.indices.exists(index=self.job_index):
-                job_stats = self.client.count(index=self.job_index)
-                stats['job_documents'] = job_stats.get('count', 0)
+            if self.job_index in indices:
+                stats['job_documents'] = doc_count(self.job_index)
                 
                 # Count jobs with embeddings
                 try:
-                    with_embeddings = self.client.count(
-                        index=self.job_index,
-                        body={"query": {"exists": {"field": "job_embedding"}}}
-                    )
-                    stats['jobs_with_embeddings'] = with_embeddings.get('count', 0)
+                    if isinstance(results['with_embeddings'], Exception):
+                        raise results['with_embeddings']
+                    stats['jobs_with_embeddings'] = results['with_embeddings'].get('count', 0)
                     stats['jobs_without_embeddings'] = stats['job_documents'] - stats['jobs_with_embeddings']
                 except Exception as e:
                     logger.warning(f"Could not get embedding counts: {str(e)}")
                     stats['jobs_with_embeddings'] = 'unknown'
                     stats['jobs_without_embeddings'] = 'unknown'
                 
-                # Get sample document
-                try:
-                    sample = self.client.search(index=self.job_index, body={"size": 1})
-                    stats['job_sample_available'] = len(sample['hits']['hits']) > 0
-                except:
-                    stats['job_sample_available'] = False
+                stats['job_sample_available'] = stats['job_documents'] > 0
             else:
                 stats['job_documents'] = 0
                 stats['jobs_with_embeddings'] = 0
@@ -449,8 +917,31 @@ class OpenSearchManager:
             logger.error(f"Error getting index stats: {str(e)}")
             return {
                 'cv_documents': 0, 
-                'job_documents': 0, 
+                'job_documents': 0,
                 'jobs_with_embeddings': 0,
                 'jobs_without_embeddings': 0,
                 'error': str(e)
-            }
\ No newline at end of file
+            }
+
+def get_manager() -> OpenSearchManager:
+    """Get the shared OpenSearchManager, creating it on first use"""
+    # Its SigV4 signer and client connection pool are then reused by every
+    # caller and by warm invocations of the same container
+    global _manager
+    if _manager is None:
+        _manager = OpenSearchManager()
+    return _manager
+
+def update_host(host: str):
+    """Point the shared manager, if one was created, at a re-resolved domain host"""
+    if _manager is not None:
+        _manager.set_host(host)
+
+def recommendation_filters(body: Dict) -> Dict[str, Dict]:
+    """Build recommend_for_user filters from the optional 'location' and 'role' request fields"""
+    filters = {}
+    if body.get('location'):
+        filters['location'] = {"match": {"location": body['location']}}
+    if body.get('role'):
+        filters['role'] = {"match": {"title": {"query": body['role'], "operator": "and"}}}
+    return filters
\ No newline at end of file
@@ -0,0 +1,87 @@
+import logging
+import time
+from typing import Any, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """In-process cache that matches embeddings by cosine similarity (LRU + TTL)"""
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 1024, ttl: float = 300):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clear()
+
+    def clear(self):
+        """Drop all cached entries"""
+        # Preallocated (maxsize, dim) float32 matrix of L2-normalized embeddings,
+        # allocated on first insert once the dimension is known. Only the first
+        # ``_size`` rows are in use and evicted slots are overwritten in place.
+        self._vectors = None
+        self._values = [None] * self.maxsize
+        self._created = np.zeros(self.maxsize)
+        self._last_used = np.zeros(self.maxsize)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if vector.size == 0 or not np.isfinite(norm) or norm == 0:
+            return None
+        return vector / norm
+
+    def get(self, embedding) -> Optional[Any]:
+        """Return the cached value for a similar embedding, or None on a miss"""
+        if not self._size:
+            return None
+
+        query = self._normalize(embedding)
+        if query is None or query.shape[0] != self._vectors.shape[1]:
+            return None
+
+        now = time.monotonic()
+        # Single BLAS matrix-vector product scores every cached embedding at once
+        scores = self._vectors[:self._size] @ query
+        scores[(now - self._created[:self._size]) > self.ttl] = -np.inf
+
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        self._last_used[best] = now
+        logger.debug("Semantic cache hit with similarity %.4f", scores[best])
+        return self._values[best]
+
+    def set(self, embedding, value: Any):
+        """Cache a value under the given embedding"""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        # Embeddings from a different model can't be compared with the cached ones
+        if self._vectors is not None and vector.shape[0] != self._vectors.shape[1]:
+            self.clear()
+        if self._vectors is None:
+            self._vectors = np.empty((self.maxsize, vector.shape[0]), dtype=np.float32)
+
+        now = time.monotonic()
+        slot = self._free_slot(now)
+        self._vectors[slot] = vector
+        self._values[slot] = value
+        self._created[slot] = now
+        self._last_used[slot] = now
+
+    def _free_slot(self, now: float) -> int:
+        """Pick the row to write: the next unused one, else an expired or least recently used one"""
+        if self._size < self.maxsize:
+            self._size += 1
+            return self._size - 1
+
+        expired = (now - self._created) > self.ttl
+        return int(np.argmin(np.where(expired, -np.inf, self._last_used)))
@@ -1,13 +1,44 @@
+import base64
+import binascii
 import re
-from typing import Optional
+from typing import Iterable, List, Optional
+import ahocorasick
+import numpy as np
+
+# Size of the embeddings stored in the k-NN indices (Titan v2 is requested with 1024 dimensions)
+EMBEDDING_DIMENSION = 1024
+
+# Patterns are compiled once at import instead of being looked up in re's cache on every call
+_HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+_SPECIAL_CHARS_PATTERN = re.compile(r'[^\w\s\.\,\-\(\)\@\+\:\;\!\?]')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+# The phone formats in one alternation, so the text is scanned once
+_PHONE_PATTERN = re.compile(
+    r'\+?\d{1,4}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}'
+    r'|\(\d{3}\)\s*\d{3}-\d{4}'
+    r'|\b\d{10,15}\b'
+)
+_TITLE_AFFIX_PATTERN = re.compile(r'\b(jr|sr|senior|junior|lead|principal)\b', re.IGNORECASE)
+# Case-insensitive, so the text doesn't have to be lowercased first
+_DATE_RANGE_PATTERNS = [
+    re.compile(r'(\d{4})\s*[-–]\s*(\d{4})', re.IGNORECASE),  # 2020-2023
+    re.compile(r'(\d{4})\s*[-–]\s*(present|current)', re.IGNORECASE),  # 2020-Present
+    re.compile(r'(\d{4})\s*to\s*(\d{4})', re.IGNORECASE),  # 2020 to 2023
+    re.compile(r'(\d{4})\s*to\s*(present|current)', re.IGNORECASE)  # 2020 to Present
+]
 
 def extract_user_id_from_key(object_key: str) -> Optional[str]:
     """Extract user_id from S3 object key"""
     try:
-        parts = object_key.split('/')
-        if len(parts) >= 2:
-            return parts[0] if parts[0] != 'structured' else parts[1] if len(parts) >= 3 else None
-        return None
+        # partition() looks at the first two segments without splitting the whole key
+        head, sep, rest = object_key.partition('/')
+        if not sep:
+            return None
+        if head != 'structured':
+            return head
+        user_id, sep, _ = rest.partition('/')
+        return user_id if sep else None
     except Exception:
         return None
 
@@ -16,75 +47,106 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text)
-    
     # Remove HTML tags if any
-    text = re.sub(r'<[^>]+>', '', text)
+    text = _HTML_TAG_PATTERN.sub('', text)
     
     # Remove special characters but keep basic punctuation
-    text = re.sub(r'[^\w\s\.\,\-\(\)\@\+\:\;\!\?]', ' ', text)
-    
-    # Remove extra spaces
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remove lines with only special characters
-    lines = text.split('\n')
-    clean_lines = []
-    for line in lines:
-        if line.strip() and len(line.strip()) > 2:
-            clean_lines.append(line.strip())
+    text = _SPECIAL_CHARS_PATTERN.sub(' ', text)
     
-    text = ' '.join(clean_lines)
+    # Collapse all whitespace, including the newlines, in a single pass at the end
+    text = _WHITESPACE_PATTERN.sub(' ', text).strip()
     
-    return text.strip()
+    # The text is a single line now; drop it if only a stray character or two is left
+    return text if len(text) > 2 else ""
+
+def _is_word_char(char: str) -> bool:
+    """Same notion of a word character as the regex \\w class"""
+    return char.isalnum() or char == '_'
+
+def _on_word_boundaries(text: str, start: int, end: int) -> bool:
+    """Check that text[start:end + 1] begins and ends on a regex \\b boundary"""
+    before = start > 0 and _is_word_char(text[start - 1])
+    after = end < len(text) - 1 and _is_word_char(text[end + 1])
+    return before != _is_word_char(text[start]) and after != _is_word_char(text[end])
+
+def build_keyword_automaton(keywords: Iterable[str]) -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton matching any of the given (lowercase) keywords"""
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+def find_keywords(automaton: ahocorasick.Automaton, text: str) -> List[str]:
+    """Find keywords in text in one pass, in order of appearance and without duplicates.
+
+    A match only counts if it is delimited like a regex \\b<keyword>\\b match would be.
+    """
+    # dict.fromkeys dedupes in C while keeping the first-seen order
+    return list(dict.fromkeys(
+        keyword for end, keyword in automaton.iter(text)
+        if _on_word_boundaries(text, end - len(keyword) + 1, end)
+    ))
 
 def validate_embedding(embedding) -> bool:
-    """Validate that embedding is valid"""
-    if not embedding:
-        return False
-    if not isinstance(embedding, list):
+    """Validate that embedding is a non-empty list or numpy vector of finite numbers"""
+    if isinstance(embedding, list):
+        if not embedding:
+            return False
+        # One conversion in C instead of a type check per value; None or non-numeric
+        # values leave an object or string array, which fails the dtype check below
+        try:
+            embedding = np.asarray(embedding)
+        except ValueError:
+            return False
+    elif not isinstance(embedding, np.ndarray):
         return False
-    if len(embedding) == 0:
-        return False
-    if not all(isinstance(x, (int, float)) for x in embedding):
-        return False
-    return True
+    
+    return (
+        embedding.ndim == 1 and
+        embedding.size > 0 and
+        embedding.dtype.kind in 'iuf' and
+        bool(np.isfinite(embedding).all())
+    )
+
+def decode_embedding(embedding):
+    """Decode an embedding passed as {"dtype", "shape", "data": base64 bytes} into a numpy array.
+
+    Any other value (a list or an array) is returned unchanged. None is returned if the buffer is
+    malformed or isn't a float32 vector of EMBEDDING_DIMENSION values.
+    """
+    if not isinstance(embedding, dict):
+        return embedding
+    try:
+        if embedding.get('dtype', 'float32') != 'float32' or list(embedding['shape']) != [EMBEDDING_DIMENSION]:
+            return None
+        # One base64 decode and a zero-copy view of the buffer, no Python float per value
+        data = base64.b64decode(embedding['data'], validate=True)
+        vector = np.frombuffer(data, dtype=np.float32)
+    except (KeyError, TypeError, ValueError, binascii.Error):
+        return None
+    return vector if vector.size == EMBEDDING_DIMENSION else None
 
 def truncate_text(text: str, max_length: int = 8000) -> str:
     """Truncate text to maximum length while preserving word boundaries"""
     if len(text) <= max_length:
         return text
     
-    # Find last space before max_length
-    truncated = text[:max_length]
-    last_space = truncated.rfind(' ')
-    
-    if last_space > max_length * 0.8:  # If space is reasonably close
-        truncated = truncated[:last_space]
+    # Find last space before max_length, only looking where it is reasonably close
+    # (past 80% of max_length) and without slicing the text first
+    last_space = text.rfind(' ', int(max_length * 0.8) + 1, max_length)
     
-    return truncated + "..."
+    return text[:last_space if last_space != -1 else max_length] + "..."
 
 def extract_email_from_text(text: str) -> Optional[str]:
     """Extract email address from text"""
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    matches = re.findall(email_pattern, text)
-    return matches[0] if matches else None
+    match = _EMAIL_PATTERN.search(text)
+    return match.group(0) if match else None
 
 def extract_phone_from_text(text: str) -> Optional[str]:
     """Extract phone number from text"""
-    phone_patterns = [
-        r'\+?\d{1,4}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}',
-        r'\b\d{10,15}\b',
-        r'\(\d{3}\)\s*\d{3}-\d{4}'
-    ]
-    
-    for pattern in phone_patterns:
-        matches = re.findall(pattern, text)
-        if matches:
-            return matches[0]
-    
-    return None
+    match = _PHONE_PATTERN.search(text)
+    return match.group(0) if match else None
 
 def normalize_job_title(title: str) -> str:
     """Normalize job title for better matching"""
@@ -92,35 +154,29 @@ def normalize_job_title(title: str) -> str:
         return ""
     
     # Remove common prefixes/suffixes
-    title = re.sub(r'\b(jr|sr|senior|junior|lead|principal)\b', '', title, flags=re.IGNORECASE)
+    title = _TITLE_AFFIX_PATTERN.sub('', title)
     
     # Clean up extra spaces
-    title = re.sub(r'\s+', ' ', title).strip()
+    title = _WHITESPACE_PATTERN.sub(' ', title).strip()
     
     # Convert to title case
     return title.title()
 
 def extract_years_from_date_range(text: str) -> int:
     """Extract years of experience from date ranges like '2020-2023' or '2020-Present'"""
-    patterns = [
-        r'(\d{4})\s*[-–]\s*(\d{4})',  # 2020-2023
-        r'(\d{4})\s*[-–]\s*(present|current)',  # 2020-Present
-        r'(\d{4})\s*to\s*(\d{4})',  # 2020 to 2023
-        r'(\d{4})\s*to\s*(present|current)'  # 2020 to Present
-    ]
-    
     current_year = 2024  # Update as needed
     total_years = 0
     
-    for pattern in patterns:
-        matches = re.findall(pattern, text.lower())
-        for match in matches:
+    for pattern in _DATE_RANGE_PATTERNS:
+        # finditer yields the matches one by one instead of building a list of tuples
+        for match in pattern.finditer(text):
             try:
-                start_year = int(match[0])
-                if match[1] in ['present', 'current']:
+                start_year = int(match.group(1))
+                end = match.group(2)
+                if end.lower() in ('present', 'current'):
                     end_year = current_year
                 else:
-                    end_year = int(match[1])
+                    end_year = int(end)
                 
                 years = max(0, end_year - start_year)
                 total_years += years